@@ -23,10 +23,13 @@
 
     'data': [
         'security/ir.model.access.csv',
+        'data/ir_cron.xml',
+        'views/web_progress_cron_run_views.xml',
     ],
     'assets': {
         'web.assets_backend': [
             'web_progress/static/src/js/rpc_service.js',
+            'web_progress/static/src/js/progress_poller.js',
             'web_progress/static/src/js/loading.js',
             'web_progress/static/src/js/progress_bar.js',
             '/web_progress/static/src/js/ajax.js',
@@ -1,7 +1,17 @@
 import json
-from odoo import http
-from odoo.http import request
+import operator
+import os
+import tempfile
+import xlsxwriter
+from xlsxwriter.format import Format
+from werkzeug.wsgi import wrap_file
+from odoo import http, _
+from odoo.exceptions import UserError
+from odoo.http import request, content_disposition
+from odoo.tools import osutil, pycompat
+from odoo.addons.web.controllers.export import CSVExport, XLSXExport, ExportXlsxWriter
 from odoo.addons.web.controllers.report import ReportController
+from ..models.web_progress import json_dump
 
 class WPReportController(ReportController):
 
@@ -9,10 +19,163 @@ class WPReportController(ReportController):
     def report_download(self, data, context=None, token=None):
         """
         Get web progress code from the context
+        Allow parallel rendering of PDF reports (see web_progress_report_workers option)
         """
         parsed_context = json.loads(context or '{}')
         web_progress_obj = request.env['web.progress'].with_context(**parsed_context)
         web_progress_obj.web_progress_percent(0, 'Report')
+        if web_progress_obj._progress_report_workers:
+            context = json.dumps(dict(parsed_context, web_progress_parallel_report=True))
         ret = super(WPReportController, self).report_download(data, context, token)
         web_progress_obj.web_progress_percent(100, 'Report done')
-        return ret
\ No newline at end of file
+        return ret
+
+
+class WPProgressController(http.Controller):
+    # maximal number of codes polled at once
+    poll_limit = 100
+
+    @http.route(['/web_progress/poll'], type='http', auth="user", methods=['GET'])
+    def progress_poll(self, codes='', **kwargs):
+        """
+        Get progress of many operations at once, straight from the in-process or shared progress registry,
+        without opening a fresh cursor. Only operations not found in memory are read from the database
+        (with the cursor of the request). Unchanged progress is answered with 304 Not Modified (ETag).
+        :param codes: comma-separated web progress codes
+        :return: JSON dict of lists of progress vals (one for every recursion depth) per code
+        """
+        codes = [code for code in codes.split(',') if code][:self.poll_limit]
+        progress_obj = request.env['web.progress']
+        result = progress_obj._get_progress_memory(codes)
+        missing_codes = [code for code in codes if code not in result]
+        if missing_codes:
+            result.update(progress_obj.get_progress_multi(missing_codes))
+        body = json_dump(result)
+        response = request.make_response(body, headers=[('Content-Type', 'application/json'),
+                                                        ('Cache-Control', 'no-cache')])
+        response.add_etag()
+        return response.make_conditional(request.httprequest)
+
+
+class StreamingXlsxWriter(ExportXlsxWriter):
+    """
+    ExportXlsxWriter writing into a file in constant memory mode, i.e. every row is flushed
+    to a temporary file once the next row is written
+    """
+    # attributes of xlsxwriter formats bound to their workbook
+    format_index_attrs = ('xf_format_indices', 'dxf_format_indices', 'xf_index', 'dxf_index')
+
+    def __init__(self, field_names, row_count, fileobj):
+        super(StreamingXlsxWriter, self).__init__(field_names, row_count)
+        self._switch_workbook(fileobj)
+
+    def _switch_workbook(self, fileobj):
+        """
+        Replace the in-memory workbook created by ExportXlsxWriter with a constant memory workbook
+        writing into fileobj, with the same formats
+        :param fileobj: binary file to write into
+        """
+        self.workbook.close()
+        formats = {name: value for name, value in vars(self).items() if isinstance(value, Format)}
+        self.output = fileobj
+        self.workbook = xlsxwriter.Workbook(self.output, {'constant_memory': True})
+        for name, old_format in formats.items():
+            new_format = self.workbook.add_format()
+            new_format.__dict__.update({key: value for key, value in vars(old_format).items()
+                                        if key not in self.format_index_attrs})
+            setattr(self, name, new_format)
+        self.worksheet = self.workbook.add_worksheet()
+
+    def check_row_count(self, row_count):
+        if row_count > self.worksheet.xls_rowmax:
+            raise UserError(_('There are too many rows (%s rows, limit: %s) to export as Excel 2007-2013 (.xlsx) '
+                              'format. Consider splitting the export.') % (row_count, self.worksheet.xls_rowmax))
+
+    def close(self):
+        # the file is streamed back, it is not read into memory
+        self.workbook.close()
+
+
+class WPExportFormat(object):
+    """
+    Streaming export: rows are exported by batches of records and every batch is written straight
+    into a temporary file, which is then streamed back, so the memory usage does not depend on the size
+    of the export (see web_progress_stream_export option). Grouped exports are not streamed.
+    """
+
+    def base(self, data):
+        params = json.loads(data)
+        if not request.env['web.progress']._progress_stream_export or \
+                (params.get('groupby') and not params.get('import_compat')):
+            return super(WPExportFormat, self).base(data)
+        model, fields, ids, domain, import_compat = \
+            operator.itemgetter('model', 'fields', 'ids', 'domain', 'import_compat')(params)
+
+        Model = request.env[model].with_context(import_compat=import_compat, **params.get('context', {}))
+        if not Model._is_an_ordinary_table():
+            fields = [field for field in fields if field['name'] != 'id']
+
+        field_names = [f['name'] for f in fields]
+        if import_compat:
+            columns_headers = field_names
+        else:
+            columns_headers = [val['label'].strip() for val in fields]
+
+        records = Model.browse(ids) if ids else Model.search(domain, offset=0, limit=False, order=False)
+        fileobj = tempfile.TemporaryFile()
+        try:
+            self.from_data_batches(fileobj, columns_headers, len(records), records._export_data_batches(field_names))
+            size = fileobj.seek(0, os.SEEK_END)
+            fileobj.seek(0)
+        except Exception:
+            fileobj.close()
+            raise
+        return request.make_response(
+            wrap_file(request.httprequest.environ, fileobj),
+            headers=[('Content-Disposition',
+                      content_disposition(osutil.clean_filename(self.filename(model) + self.extension))),
+                     ('Content-Type', self.content_type),
+                     ('Content-Length', size)],
+        )
+
+    def from_data_batches(self, fileobj, fields, row_count, rows_batches):
+        """
+        Write exported rows into a file
+        :param fileobj: binary file to write into
+        :param fields: list of column headers
+        :param row_count: number of exported records
+        :param rows_batches: generator of lists of exported rows
+        """
+        raise NotImplementedError()
+
+
+class WPCSVExport(WPExportFormat, CSVExport):
+
+    def from_data_batches(self, fileobj, fields, row_count, rows_batches):
+        writer = pycompat.csv_writer(fileobj, quoting=1)
+        writer.writerow(fields)
+        for rows in rows_batches:
+            for data in rows:
+                row = []
+                for d in data:
+                    # Spreadsheet apps tend to detect formulas on leading =, + and -
+                    if isinstance(d, str) and d.startswith(('=', '-', '+')):
+                        d = "'" + d
+                    row.append(pycompat.to_text(d))
+                writer.writerow(row)
+
+
+class WPXLSXExport(WPExportFormat, XLSXExport):
+
+    def from_data_batches(self, fileobj, fields, row_count, rows_batches):
+        with StreamingXlsxWriter(fields, row_count, fileobj) as xlsx_writer:
+            row_index = 0
+            for rows in rows_batches:
+                # sub-records may add rows, so the limit is checked again
+                xlsx_writer.check_row_count(row_index + len(rows))
+                for row in rows:
+                    row_index += 1
+                    for cell_index, cell_value in enumerate(row):
+                        if isinstance(cell_value, (list, tuple)):
+                            cell_value = pycompat.to_text(cell_value)
+                        xlsx_writer.write_cell(row_index, cell_index, cell_value)
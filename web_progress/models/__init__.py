@@ -2,4 +2,10 @@ from . import base
 from . import base_import
 from . import ir_actions_report
 from . import ir_cron
-from . import web_progress
\ No newline at end of file
+from . import ir_websocket
+from . import web_progress
+from . import web_progress_active
+from . import web_progress_checkpoint
+from . import web_progress_cron_run
+from . import web_progress_history
+from . import web_progress_job
\ No newline at end of file
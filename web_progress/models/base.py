@@ -1,6 +1,14 @@
 # Part of web_progress. See LICENSE file for full copyright and licensing details.
 from odoo import models, api, registry, fields, _
+from odoo.exceptions import UserError
+from odoo.models import fix_import_export_id_paths
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from threading import Event, current_thread
+from time import monotonic
 import logging
+import psutil
 
 _logger = logging.getLogger(__name__)
 
@@ -35,16 +43,185 @@ class Base(models.AbstractModel):
     # Progress reporting
     #
 
-    def with_progress(self, msg='', total=None, cancellable=True, log_level="info"):
+    def with_progress(self, msg='', total=None, cancellable=True, log_level="info", batch_size=None,
+                      checkpoint_key=None, time_budget=None, memory_budget=None):
         """
         Wrap self (current recordset) with progress reporting generator
         :param msg: msg to mass in progress report
         :param total: provide total directly to avoid calling len on data (which fails on generators)
         :param cancellable: indicates whether the operation is cancellable
         :param log_level: log level to use when logging progress
+        :param batch_size: if given, yield batches (sub-recordsets) of this size instead of single records
+        :param checkpoint_key: if given, resume the iteration after records processed by a previous run
+            (see web_progress_iter)
+        :param time_budget: maximal duration of the operation in seconds (see web_progress_iter)
+        :param memory_budget: maximal memory of the server process in MB (see web_progress_iter)
         :return: yields every element of data
         """
-        return self.web_progress_iter(self, msg=msg, total=total, cancellable=cancellable, log_level=log_level)
+        if batch_size:
+            return self.web_progress_batches(msg=msg, batch_size=batch_size, cancellable=cancellable,
+                                             log_level=log_level, checkpoint_key=checkpoint_key,
+                                             time_budget=time_budget, memory_budget=memory_budget)
+        return self.web_progress_iter(self, msg=msg, total=total, cancellable=cancellable, log_level=log_level,
+                                      checkpoint_key=checkpoint_key, time_budget=time_budget,
+                                      memory_budget=memory_budget)
+
+    def web_progress_batches(self, msg='', batch_size=1000, cancellable=True, log_level="info", adaptive=False,
+                             checkpoint_key=None, time_budget=None, memory_budget=None):
+        """
+        Progress reporting generator of batches (sub-recordsets) of self (current recordset).
+        Progress is reported in records. Every batch prefetches only its own records
+        and is evicted from the cache once processed.
+        :param msg: msg to mass in progress report
+        :param batch_size: number of records in a batch (the initial one if adaptive)
+        :param cancellable: indicates whether the operation is cancellable
+        :param log_level: log level to use when logging progress
+        :param adaptive: adapt the batch size to the time and memory growth observed per batch
+            (see web_progress_batch_secs and web_progress_batch_memory_mb options)
+        :param checkpoint_key: if given, resume the iteration after records processed by a previous run
+            (see web_progress_iter)
+        :param time_budget: maximal duration of the operation in seconds (see web_progress_iter)
+        :param memory_budget: maximal memory of the server process in MB (see web_progress_iter)
+        :return: yields batches of records
+        """
+        checkpoint = None
+        skip = 0
+        if checkpoint_key:
+            checkpoint, skip = self.env['web.progress.checkpoint']._resume(checkpoint_key, self)
+            self = self[skip:]
+        total = len(self)
+        progress_iter = iter(self.web_progress_iter(range(total), msg=msg, total=total, cancellable=cancellable,
+                                                    log_level=log_level, time_budget=time_budget,
+                                                    memory_budget=memory_budget))
+        process = adaptive and psutil.Process()
+        idx = 0
+        try:
+            while idx < total:
+                # browse only the ids of the batch so that only the batch is prefetched
+                batch = self.browse(self._ids[idx:idx + batch_size])
+                # progress of the first record of the batch is reported before the batch is processed
+                next(progress_iter)
+                start_time = monotonic()
+                start_memory = process and process.memory_info().rss
+                yield batch
+                deque(islice(progress_iter, len(batch) - 1), maxlen=0)
+                if process:
+                    batch_size = self._web_progress_batch_size(batch_size, monotonic() - start_time,
+                                                               process.memory_info().rss - start_memory)
+                batch.invalidate_recordset()
+                idx += len(batch)
+                if checkpoint:
+                    checkpoint._save(skip + idx, batch[-1:])
+            # let the progress reporting generator report the end
+            deque(progress_iter, maxlen=0)
+            if checkpoint:
+                checkpoint.unlink()
+        finally:
+            if hasattr(progress_iter, 'close'):
+                progress_iter.close()
+
+    @api.model
+    def _web_progress_batch_size(self, batch_size, batch_secs, batch_memory):
+        """
+        Compute the size of the next batch of adaptive batch iteration
+        :param batch_size: size of the last batch
+        :param batch_secs: time of processing of the last batch (in seconds)
+        :param batch_memory: memory growth during processing of the last batch (in bytes)
+        :return: size of the next batch
+        """
+        web_progress_obj = self.env['web.progress']
+        ratio = 2.0
+        if batch_secs > 0:
+            ratio = min(ratio, web_progress_obj._progress_batch_secs / batch_secs)
+        if batch_memory > 0:
+            ratio = min(ratio, web_progress_obj._progress_batch_memory_mb * 1024 * 1024 / batch_memory)
+        # change the size smoothly
+        return max(int(batch_size * max(ratio, 0.5)), 1)
+
+    @api.model
+    def web_progress_map(self, func, records, workers=4, chunk_size=100, msg='', cancellable=True, log_level="info",
+                         commit=True):
+        """
+        Apply a function to chunks of records in a pool of worker threads, progress of all workers is reported
+        (in records) as progress of the operation identified by progress_code in context.
+        Every chunk is processed in a fresh transaction of a worker, committed once the chunk is processed
+        (unless commit is False) and rolled back on error or cancel, which also stops all the workers.
+        Records created or changed by the current (not yet committed) transaction are not visible to workers.
+        :param func: function called with every chunk of records (browsed in the environment of a worker),
+            it shall not return records
+        :param records: records to process
+        :param workers: number of worker threads
+        :param chunk_size: number of records in a chunk
+        :param msg: msg to mass in progress report
+        :param cancellable: indicates whether the operation is cancellable
+        :param log_level: log level to use when logging progress
+        :param commit: whether to commit processed chunks
+        :return: list of results of func, in the order of chunks
+        """
+        dbname = self.env.cr.dbname
+        uid = self.env.uid
+        # progress of workers is reported by the calling thread only
+        context = dict(self.env.context)
+        code = context.pop('progress_code', None)
+        chunks = [records._ids[idx:idx + chunk_size] for idx in range(0, len(records), chunk_size)]
+        stop = Event()
+
+        def run_chunk(ids):
+            if stop.is_set():
+                return None
+            current_thread().dbname = dbname
+            cr = registry(dbname).cursor()
+            try:
+                env = api.Environment(cr, uid, context)
+                result = func(env[records._name].browse(ids))
+                env.flush_all()
+                if commit and not stop.is_set():
+                    cr.commit()
+                else:
+                    cr.rollback()
+                return result
+            except Exception:
+                cr.rollback()
+                stop.set()
+                raise
+            finally:
+                cr.close()
+
+        web_progress_obj = self.env['web.progress']
+        results = [None] * len(chunks)
+        progress_iter = iter(self.web_progress_iter(range(len(records)), msg=msg, total=len(records),
+                                                    cancellable=cancellable, log_level=log_level))
+        # report the beginning of the operation
+        skip = next(progress_iter, None) is not None and 1 or 0
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='web_progress.map') as executor:
+                futures = {executor.submit(run_chunk, ids): idx for idx, ids in enumerate(chunks)}
+                pending = set(futures)
+                try:
+                    while pending:
+                        done, pending = wait(pending, timeout=web_progress_obj._progress_period_secs,
+                                             return_when=FIRST_COMPLETED)
+                        for future in done:
+                            idx = futures[future]
+                            results[idx] = future.result()
+                            deque(islice(progress_iter, len(chunks[idx]) - skip), maxlen=0)
+                            skip = 0
+                        if not done and code and cancellable:
+                            # long chunks, check for cancel without waiting for progress reports
+                            user_id = web_progress_obj._check_cancelled(dict(code=code))
+                            if user_id:
+                                web_progress_obj._raise_cancelled(code, user_id)
+                except BaseException:
+                    # running chunks are rolled back, pending chunks are not started
+                    stop.set()
+                    for future in pending:
+                        future.cancel()
+                    raise
+            deque(progress_iter, maxlen=0)
+        finally:
+            if hasattr(progress_iter, 'close'):
+                progress_iter.close()
+        return results
 
     @api.model
     def web_progress_percent(self, percent, msg='', cancellable=True, log_level="info"):
@@ -77,7 +254,8 @@ class Base(models.AbstractModel):
             web_progress_obj._report_progress_do_percent(params)
 
     @api.model
-    def web_progress_iter(self, data, msg='', total=None, cancellable=True, log_level="info"):
+    def web_progress_iter(self, data, msg='', total=None, cancellable=True, log_level="info", checkpoint_key=None,
+                          time_budget=None, memory_budget=None):
         """
         Progress reporting generator of an ongoing operation identified by progress_code in context.
         :param data: collection / generator to iterate onto
@@ -85,8 +263,21 @@ class Base(models.AbstractModel):
         :param total: provide total directly to avoid calling len on data (which fails on generators)
         :param cancellable: indicates whether the operation is cancellable
         :param log_level: log level to use when logging progress
+        :param checkpoint_key: if given, the position of the iteration is stored (in the current transaction)
+            under this key and the next iteration with the same key skips elements processed (and committed)
+            by a previous, unfinished iteration; records are skipped by the id of the last processed record,
+            other collections by the number of processed elements (so their order shall not change)
+        :param time_budget: maximal duration of the operation in seconds, checked on every progress report;
+            a cancellable operation exceeding its time or memory budget is cancelled (default is system parameter
+            web_progress.time_budget or, in multi-process mode, 90% of limit_time_real)
+        :param memory_budget: maximal memory of the server process in MB (default is system parameter
+            web_progress.memory_budget or, in multi-process mode, 90% of limit_memory_hard)
         :return: yields every element of data
         """
+        if checkpoint_key:
+            return self._web_progress_checkpoint_iter(data, checkpoint_key, msg=msg, total=total,
+                                                      cancellable=cancellable, log_level=log_level,
+                                                      time_budget=time_budget, memory_budget=memory_budget)
         if not self.env.context.get('progress_code'):
             return data
         if total is None:
@@ -99,10 +290,51 @@ class Base(models.AbstractModel):
                                                                                    msg=msg,
                                                                                    total=total,
                                                                                    cancellable=cancellable,
-                                                                                   log_level=log_level),
+                                                                                   log_level=log_level,
+                                                                                   time_budget=time_budget,
+                                                                                   memory_budget=memory_budget),
                                          total,
                                          data)
 
+    def _web_progress_checkpoint_iter(self, data, checkpoint_key, msg='', total=None, cancellable=True,
+                                      log_level="info", time_budget=None, memory_budget=None):
+        """
+        Progress reporting generator resuming the iteration from its checkpoint (see web_progress_iter)
+        :return: yields every element of data not processed yet
+        """
+        checkpoint, skip = self.env['web.progress.checkpoint']._resume(checkpoint_key, data)
+        if total is None:
+            try:
+                total = len(data)
+            except:
+                total = None
+        if skip:
+            try:
+                data = data[skip:]
+            except TypeError:
+                data = islice(data, skip, None)
+            if total is not None:
+                total = max(total - skip, 0)
+        period_secs = self.env['web.progress']._progress_period_secs
+
+        def checkpoint_iter(progress_iter):
+            position = skip
+            next_save = monotonic() + period_secs
+            for elem in progress_iter:
+                yield elem
+                position += 1
+                if monotonic() >= next_save:
+                    checkpoint._save(position, elem)
+                    next_save = monotonic() + period_secs
+            checkpoint.unlink()
+
+        progress_iter = self.web_progress_iter(data, msg=msg, total=total, cancellable=cancellable,
+                                               log_level=log_level, time_budget=time_budget,
+                                               memory_budget=memory_budget)
+        if total is None:
+            return checkpoint_iter(progress_iter)
+        return GeneratorWithLenIndexable(checkpoint_iter(progress_iter), total, data)
+
     def web_progress_cancel(self, code=None):
         """
         Cancel progress of current operation or, if code given by argument, an operation of a given progress code
@@ -134,6 +366,10 @@ class Base(models.AbstractModel):
         It adds progress reporting to all standard imports and additionally makes them cancellable
         """
         extracted = super(Base, self)._extract_records(fields_, data, log=log, limit=limit)
+        batch_size = self.env['web.progress']._progress_import_batch_size
+        import_flush = self._context.get('import_flush')
+        if batch_size and import_flush:
+            extracted = self._web_progress_import_batches(extracted, import_flush, batch_size)
         if 'progress_code' in self._context:
             total = min(limit, len(data) - len(self._context.get('skip_records', [])))
             return self.web_progress_iter(extracted, _("importing to {}").
@@ -142,24 +378,60 @@ class Base(models.AbstractModel):
         else:
             return extracted
 
+    @api.model
+    def _web_progress_import_batches(self, extracted, import_flush, batch_size):
+        """
+        Let load() create imported records by batches: load() collects all converted records and creates them
+        at once (under a savepoint, retried record by record on error) at the end of the import,
+        flushing the collected records regularly bounds the memory and the scope of retries
+        :param extracted: generator of extracted records
+        :param import_flush: flush function of load() (from import_flush in context)
+        :param batch_size: number of records in a batch
+        :return: yields every extracted record
+        """
+        start_time = monotonic()
+        for idx, record in enumerate(extracted):
+            if idx and not idx % batch_size:
+                # all the records extracted so far are converted and collected by load()
+                import_flush()
+                batch_secs = max(monotonic() - start_time, 1e-6)
+                _logger.info("Imported {} records to {} in {:.2f}s ({:.0f} records/s)".format(
+                    batch_size, self._name, batch_secs, batch_size / batch_secs))
+                start_time = monotonic()
+            yield record
+
     def _export_rows(self, fields, *args, _is_toplevel_call=True):
         """
         Add progress reporting to base export (on batch-level)
         """
         if _is_toplevel_call and 'progress_code' in self._context:
-            def splittor(rs):
-                """ Splits the self recordset in batches of 1000 (to avoid
-                entire-recordset-prefetch-effects) & removes the previous batch
-                from the cache after it's been iterated in full
-                """
-                for idx in self.web_progress_iter(range(0, len(rs), 1000), _("exporting batches of 1000 lines") +
-                                                                           " ({})".format(self._description)):
-                    sub = rs[idx:idx + 1000]
-                    yield sub
-                    sub.invalidate_recordset()
-
             ret = []
-            for sub in splittor(self):
-                ret += super(Base, sub)._export_rows(fields, _is_toplevel_call=_is_toplevel_call)
+            for rows in self._export_rows_batches(fields):
+                ret += rows
             return ret
         return super(Base, self)._export_rows(fields, _is_toplevel_call=_is_toplevel_call)
+
+    def _export_rows_batches(self, fields, batch_size=1000):
+        """
+        Export rows by batches of records with progress reporting (on batch-level)
+        Batches avoid entire-recordset-prefetch-effects and every batch
+        is removed from the cache after it's been iterated in full
+        :param fields: list of paths of fields to export, as in _export_rows
+        :param batch_size: number of records in a batch
+        :return: yields lists of rows of every batch
+        """
+        for sub in self.web_progress_batches(_("exporting lines") + " ({})".format(self._description),
+                                             batch_size=batch_size):
+            yield super(Base, sub)._export_rows(fields, _is_toplevel_call=True)
+
+    def _export_data_batches(self, fields_to_export):
+        """
+        Same as export_data, but rows are exported lazily by batches of records,
+        so that they can be written out without keeping all of them in memory
+        :param fields_to_export: list of fields to export
+        :return: generator of lists of rows of every batch
+        """
+        if not (self.env.is_admin() or self.env.user.has_group('base.group_allow_export')):
+            raise UserError(_("You don't have the rights to export data. Please contact an Administrator."))
+        fields_to_export = [fix_import_export_id_paths(f) for f in fields_to_export]
+        return self._export_rows_batches(fields_to_export)
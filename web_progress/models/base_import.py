@@ -1,6 +1,28 @@
 # Part of web_progress. See LICENSE file for full copyright and licensing details.
 from odoo import models, api, registry, fields, _
 from odoo.exceptions import UserError
+from collections import OrderedDict, deque
+from threading import Lock
+import hashlib
+import json
+from .web_progress import BackgroundProgress
+
+# parsed import data by file, options and fields, the real import reuses the data parsed by its test (dry run)
+import_cache = OrderedDict()
+import_cache_lock = Lock()
+
+
+class ParsedImportData(list):
+    """
+    Rows of import data taken from the cache, already parsed
+    """
+
+
+class ConvertedImportData(list):
+    """
+    Rows of import data read from the file, to be parsed and stored in the cache under cache_key
+    """
+    cache_key = None
 
 
 class BaseImport(models.TransientModel):
@@ -9,12 +31,76 @@ class BaseImport(models.TransientModel):
     def execute_import(self, fields, columns, options, dryrun=False):
         """
         Catch UserError exception and pass it as an error.
-        Re-raise all other errors
+        Re-raise all other errors and BackgroundProgress, so the import moved to background is rolled back
+        Report progress in two phases: parsing of the file and import of the parsed data
         """
+        phases = None
+        new_self = self
+        if 'progress_code' in self._context:
+            phases = iter(self.web_progress_iter([_("parsing"), _("importing")],
+                                                 msg=_("import of file {}").format(self.file_name or '')))
+            # parsing phase, the importing phase starts once the data is parsed
+            next(phases)
+            new_self = self.with_context(web_progress_import_phases=phases)
         try:
-            ret = super(BaseImport, self).execute_import(fields, columns, options, dryrun=dryrun)
+            ret = super(BaseImport, new_self).execute_import(fields, columns, options, dryrun=dryrun)
+            if phases:
+                deque(phases, maxlen=0)
+        except BackgroundProgress:
+            raise
         except UserError as e:
             ret = {'messages': [{'record': False, 'type': 'warning', 'message': e.args[0], }]}
         except Exception:
             raise
+        finally:
+            if hasattr(phases, 'close'):
+                phases.close()
         return ret
+
+    def _web_progress_cache_key(self, fields, options):
+        """
+        Key of parsed import data in the cache
+        :param fields: import fields of all columns, False for skipped columns
+        :param options: import options
+        :return: (tuple) key
+        """
+        return (self.env.cr.dbname, self.env.uid, self.res_model, hashlib.sha1(self.file or b'').hexdigest(),
+                json.dumps(options, sort_keys=True, default=str), tuple(fields))
+
+    def _convert_import_data(self, fields, options):
+        """
+        Take data parsed by a previous run with the same file, options and fields from the cache
+        """
+        if not self.env['web.progress']._progress_import_cache_size:
+            return super(BaseImport, self)._convert_import_data(fields, options)
+        key = self._web_progress_cache_key(fields, options)
+        with import_cache_lock:
+            cached = import_cache.get(key)
+            if cached:
+                import_cache.move_to_end(key)
+        if cached:
+            data, import_fields = cached
+            # rows may be changed by the import, so they are copied
+            return ParsedImportData(list(row) for row in data), list(import_fields)
+        data, import_fields = super(BaseImport, self)._convert_import_data(fields, options)
+        # the key is made of fields of all columns, since skipped columns are removed from import fields
+        data = ConvertedImportData(data)
+        data.cache_key = key
+        return data, import_fields
+
+    def _parse_import_data(self, data, import_fields, options):
+        """
+        Keep parsed data in the cache (unless taken from the cache) and start the importing phase
+        """
+        key = getattr(data, 'cache_key', None)
+        if not isinstance(data, ParsedImportData):
+            data = super(BaseImport, self)._parse_import_data(data, import_fields, options)
+        if key:
+            with import_cache_lock:
+                import_cache[key] = ([list(row) for row in data], list(import_fields))
+                while len(import_cache) > self.env['web.progress']._progress_import_cache_size:
+                    import_cache.popitem(last=False)
+        phases = self._context.get('web_progress_import_phases')
+        if phases:
+            next(phases, None)
+        return data
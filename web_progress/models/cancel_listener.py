@@ -0,0 +1,107 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo import sql_db
+from threading import Lock, Thread
+from .progress_state import get_state
+import json
+import logging
+import os
+import selectors
+import time
+
+_logger = logging.getLogger(__name__)
+
+# channel of cancel notifications, sent (like bus notifications) in the postgres database
+CHANNEL = 'web_progress_cancel'
+
+
+class CancelListener(Thread):
+    """
+    Listener of cancel notifications (PostgreSQL LISTEN / NOTIFY), one in every server process.
+    A notified operation running in this process is marked as cancelled, so it is cancelled on its next
+    iteration, and (optionally) the SQL statement running in its database backend is cancelled.
+    """
+    listener = None
+    listener_lock = Lock()
+    # time to wait for notifications (in seconds)
+    timeout = 50
+
+    def __init__(self, cancel_backend):
+        super(CancelListener, self).__init__(name='web_progress.cancel_listener', daemon=True)
+        self.cancel_backend = cancel_backend
+        self.pid = os.getpid()
+
+    @classmethod
+    def start_listener(cls, cancel_backend):
+        """
+        Start the listener of the current process if it does not run yet
+        :param cancel_backend: whether to cancel the running SQL statement of a cancelled operation
+        """
+        listener = cls.listener
+        if listener and listener.pid == os.getpid() and listener.is_alive():
+            return
+        with cls.listener_lock:
+            listener = cls.listener
+            # a listener inherited from the parent process (prefork) does not run in this process
+            if not listener or listener.pid != os.getpid() or not listener.is_alive():
+                cls.listener = cls(cancel_backend)
+                cls.listener.start()
+
+    @classmethod
+    def notify(cls, dbname, code):
+        """
+        Notify listeners of all server processes of a cancelled operation
+        :param dbname: database name
+        :param code: web progress code
+        """
+        with sql_db.db_connect('postgres').cursor() as cr:
+            cr.execute("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps([dbname, code])))
+
+    def run(self):
+        while True:
+            try:
+                self.listen()
+            except Exception:
+                _logger.exception('Cancel listener failed, restarting')
+                time.sleep(self.timeout / 10)
+
+    def listen(self):
+        with sql_db.db_connect('postgres').cursor() as cr, selectors.DefaultSelector() as sel:
+            cr.execute("LISTEN {}".format(CHANNEL))
+            cr.commit()
+            conn = cr._cnx
+            sel.register(conn, selectors.EVENT_READ)
+            while True:
+                if sel.select(self.timeout):
+                    conn.poll()
+                    notifications = []
+                    while conn.notifies:
+                        notifications.append(json.loads(conn.notifies.pop().payload))
+                    for dbname, code in notifications:
+                        self.cancel(cr, dbname, code)
+
+    def cancel(self, cr, dbname, code):
+        """
+        Mark an operation running in this process as cancelled and cancel its running SQL statement
+        :param cr: cursor of the listener
+        :param dbname: database name
+        :param code: web progress code
+        """
+        state = get_state(code)
+        if state is None:
+            return
+        with state.lock:
+            top = state.depths.get(0)
+            depths = list(state.depths.values())
+        if not top or not top.get('cancellable', True):
+            # operations that are not cancellable are never interrupted
+            return
+        state.cancelled = True
+        # the running statement is cancelled only if no running sub-operation is excluded from cancelling
+        if self.cancel_backend and state.backend_pid and all(params.get('cancellable', True) for params in depths):
+            cr.execute("""
+            SELECT pg_cancel_backend(pid) FROM pg_stat_activity
+            WHERE pid = %s AND datname = %s AND state = 'active'
+            """, (state.backend_pid, dbname))
+            if any(row[0] for row in cr.fetchall()):
+                _logger.info('Cancelled running statement of progress {}'.format(code))
+            cr.commit()
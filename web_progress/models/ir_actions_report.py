@@ -1,5 +1,8 @@
 # Part of web_progress. See LICENSE file for full copyright and licensing details.
 from odoo import models, api, registry, fields, _
+from odoo.tools.pdf import merge_pdf
+from collections import OrderedDict
+import io
 
 
 class IrActionsReport(models.Model):
@@ -24,6 +27,42 @@ class IrActionsReport(models.Model):
         self = self.with_context(progress_iter=True)
         return super(IrActionsReport, self)._render_qweb_pdf(report_ref, res_ids=res_ids, data=data)
 
+    def _render_qweb_pdf_prepare_streams(self, report_ref, data, res_ids=None):
+        """
+        Render PDF of chunks of records in parallel (see web_progress_report_workers option)
+        """
+        web_progress_obj = self.env['web.progress']
+        workers = web_progress_obj._progress_report_workers
+        chunk_size = web_progress_obj._progress_report_chunk_size
+        report_sudo = self._get_report(report_ref)
+        # only reports downloaded by the user are rendered in parallel, since workers see committed data only,
+        # reports saved as attachments are rendered at once
+        if not self._context.get('web_progress_parallel_report') or workers < 1 or not res_ids or \
+                len(res_ids) <= chunk_size or len(set(res_ids)) != len(res_ids) or report_sudo.attachment:
+            return super(IrActionsReport, self)._render_qweb_pdf_prepare_streams(report_ref, data, res_ids=res_ids)
+        report_id = report_sudo.id
+
+        def render_chunk(records):
+            report_obj = records.env['ir.actions.report'].with_context(web_progress_parallel_report=False)
+            return report_obj._render_qweb_pdf_prepare_streams(report_id, dict(data or {}), res_ids=records.ids)
+
+        records = self.env[report_sudo.model].browse(res_ids)
+        results = self.web_progress_map(render_chunk, records, workers=workers, chunk_size=chunk_size,
+                                        msg=_("Rendering PDF"), commit=False)
+        collected_streams = OrderedDict()
+        for streams in results:
+            collected_streams.update(streams)
+        if any(False in streams for streams in results):
+            # PDF of some chunk could not be split by records, so all chunks are merged into one PDF
+            pdf_content = merge_pdf([x['stream'].getvalue() for streams in results for x in streams.values()
+                                     if x['stream']])
+            for streams in results:
+                for x in streams.values():
+                    if x['stream']:
+                        x['stream'].close()
+            collected_streams = {False: {'stream': io.BytesIO(pdf_content), 'attachment': None}}
+        return collected_streams
+
     def _post_pdf(self, save_in_attachment, pdf_content=None, res_ids=None):
         self.web_progress_percent(90, 'Merging PDF')
         return super(IrActionsReport, self)._post_pdf(save_in_attachment, pdf_content=pdf_content, res_ids=res_ids)
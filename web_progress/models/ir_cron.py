@@ -1,6 +1,8 @@
 # Part of web_progress. See LICENSE file for full copyright and licensing details.
 from odoo import models, api, registry, fields, _
+from time import monotonic
 import uuid
+from .web_progress_cron_run import CronRunInfo
 
 
 class IrCron(models.Model):
@@ -11,6 +13,25 @@ class IrCron(models.Model):
         """
         Add web progress code if it does not exist.
         This allows to report progress of cron-executed jobs
+        Record the run in the cron run history
         """
         new_self = 'progress_code' in self._context and self or self.with_context(progress_code=str(uuid.uuid4()))
-        return super(IrCron, new_self)._callback(cron_name, server_action_id, job_id)
\ No newline at end of file
+        run_info = CronRunInfo(new_self._context['progress_code'])
+        start = fields.Datetime.now()
+        start_time = monotonic()
+        try:
+            return super(IrCron, new_self.with_context(web_progress_cron_run=run_info))._callback(
+                cron_name, server_action_id, job_id)
+        finally:
+            self.env['web.progress.cron.run']._record_run(job_id, cron_name, new_self._context['progress_code'],
+                                                          start, monotonic() - start_time, error=run_info.error,
+                                                          peak_rate=run_info.peak_rate)
+
+    def _handle_callback_exception(self, cron_name, server_action_id, job_id, job_exception):
+        """
+        Keep the error of the run for the cron run history
+        """
+        run_info = self._context.get('web_progress_cron_run')
+        if run_info:
+            run_info.error = str(job_exception)
+        return super(IrCron, self)._handle_callback_exception(cron_name, server_action_id, job_id, job_exception)
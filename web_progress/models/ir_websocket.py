@@ -0,0 +1,17 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo import models
+
+
+class IrWebsocket(models.AbstractModel):
+    _inherit = 'ir.websocket'
+
+    def _build_bus_channel_list(self, channels):
+        """
+        Subscribe progress admins to progress notifications of all users,
+        other users get notifications of their own operations on their partner channel
+        (the admin channel requested by the web client of another user is removed)
+        """
+        channels = [channel for channel in channels if channel != 'web_progress_admin']
+        if self.env.uid and self.env['web.progress'].is_progress_admin():
+            channels.append('web_progress_admin')
+        return super(IrWebsocket, self)._build_bus_channel_list(channels)
@@ -0,0 +1,140 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from contextlib import contextmanager
+from threading import current_thread
+from time import perf_counter
+import heapq
+
+
+class ProgressInstrument(object):
+    """
+    Statistics of elements of all iterations of one recursion depth of an operation:
+    number of SQL queries, SQL time and Python time spent on every element
+    (from the query counters of the thread, maintained by odoo cursors) and the slowest elements.
+    Time and queries of progress reporting itself are excluded.
+    """
+    __slots__ = ('top_k', 'elements', 'queries', 'sql_time', 'duration', 'slowest', 'excluded')
+
+    def __init__(self, top_k=5):
+        self.top_k = top_k
+        self.elements = 0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.duration = 0.0
+        # heap of the slowest elements: (duration, element id, queries)
+        self.slowest = []
+        # queries, SQL time and duration excluded from the current element
+        self.excluded = [0, 0.0, 0.0]
+
+    def add(self, elem_id, duration, queries, sql_time):
+        """
+        Record one processed element
+        :param elem_id: record id or position of the element
+        :param duration: time spent on the element (in seconds)
+        :param queries: number of SQL queries run for the element
+        :param sql_time: time of SQL queries run for the element (in seconds)
+        """
+        excluded_queries, excluded_sql_time, excluded_duration = self.excluded
+        self.excluded = [0, 0.0, 0.0]
+        duration = max(duration - excluded_duration, 0.0)
+        queries = max(queries - excluded_queries, 0)
+        sql_time = min(max(sql_time - excluded_sql_time, 0.0), duration)
+        self.elements += 1
+        self.queries += queries
+        self.sql_time += sql_time
+        self.duration += duration
+        if self.top_k:
+            item = (duration, elem_id, queries)
+            if len(self.slowest) < self.top_k:
+                heapq.heappush(self.slowest, item)
+            elif item[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def get_stats(self):
+        """
+        Get statistics per element
+        :return: dict of statistics
+        """
+        elements = self.elements or 1
+        return {
+            'elements': self.elements,
+            'queries': round(self.queries / elements, 2),
+            'sql_ms': round(1000 * self.sql_time / elements, 3),
+            'python_ms': round(1000 * (self.duration - self.sql_time) / elements, 3),
+            'rate': self.duration and round(self.elements / self.duration, 2) or 0.0,
+            # id, time (in ms) and number of queries of the slowest elements, the slowest first
+            'slowest': [[elem_id, round(1000 * duration, 1), queries]
+                        for duration, elem_id, queries in sorted(self.slowest, key=lambda item: -item[0])],
+        }
+
+    def format(self):
+        """
+        Format statistics for the server log
+        :return: str
+        """
+        stats = self.get_stats()
+        message = "{elements} elements, {queries} queries, SQL {sql_ms} ms, Python {python_ms} ms per element, " \
+                  "{rate} elements/s".format(**stats)
+        if stats['slowest']:
+            message += ", slowest: " + ", ".join("{} ({} ms, {} queries)".format(*item)
+                                                  for item in stats['slowest'])
+        return message
+
+
+def get_elem_id(elem, position):
+    """
+    Identify an element: the id of a single record or the position of the element
+    :param elem: element of iteration
+    :param position: position of the element
+    """
+    ids = getattr(elem, '_ids', None)
+    if isinstance(ids, tuple) and len(ids) == 1:
+        return ids[0]
+    return position
+
+
+def get_thread_counters():
+    """
+    Get the SQL query counters of the current thread, counting starts if the thread does not count yet
+    :return: (tuple) number and time of queries
+    """
+    thread = current_thread()
+    if not hasattr(thread, 'query_count'):
+        thread.query_count = 0
+        thread.query_time = 0.0
+    return thread.query_count, thread.query_time
+
+
+def instrument_iter(data, instrument):
+    """
+    Measure every element of data while it is processed, i.e. until the next element is requested
+    :param data: collection / generator to iterate onto
+    :param instrument: ProgressInstrument
+    :return: yields every element of data
+    """
+    for position, elem in enumerate(data):
+        queries, sql_time = get_thread_counters()
+        start = perf_counter()
+        try:
+            yield elem
+        finally:
+            # also the last element, measured when the iteration is closed
+            end_queries, end_sql_time = get_thread_counters()
+            instrument.add(get_elem_id(elem, position), perf_counter() - start, end_queries - queries,
+                           end_sql_time - sql_time)
+
+
+@contextmanager
+def excluded(instruments):
+    """
+    Exclude the enclosed code (e.g. progress reporting) from the current elements of instruments
+    :param instruments: list of ProgressInstrument
+    """
+    queries, sql_time = get_thread_counters()
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        end_queries, end_sql_time = get_thread_counters()
+        delta = [end_queries - queries, end_sql_time - sql_time, perf_counter() - start]
+        for instrument in instruments:
+            instrument.excluded = [total + value for total, value in zip(instrument.excluded, delta)]
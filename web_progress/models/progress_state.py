@@ -0,0 +1,199 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from threading import Lock, RLock, Thread, enumerate as enumerate_threads, get_ident
+from time import monotonic, sleep
+import logging
+import os
+import sys
+
+_logger = logging.getLogger(__name__)
+
+# in-process state of every ongoing operation, by progress code
+progress_states = {}
+# guards only creation and removal of states, every state has its own lock
+states_lock = Lock()
+# states not accessed for this time (in seconds) are removed by the reaper (0 means never)
+state_ttl = 0
+# maximal number of states, the least recently accessed states are evicted (0 means no limit)
+max_states = 0
+# id of the process running the reaper thread (the reaper is started again in forked processes)
+reaper_pid = None
+
+
+class ProgressState(object):
+    """
+    In-process state of one operation (progress code).
+    The lock of the state guards multi-step updates done when progress is reported (once per period),
+    single attribute reads and writes done on every iteration rely on the GIL.
+    """
+    __slots__ = ('code', 'uid', 'user_name', 'recur_depth', 'depths', 'first_report_time', 'last_report_time',
+                 'next_report_time', 'last_checkpoint_time', 'sent_msgs', 'lock', 'thread_id', 'created',
+                 'last_access', 'cancelled', 'backend_pid', 'instruments')
+
+    def __init__(self, code, uid):
+        self.code = code
+        self.uid = uid
+        # user name cached at the beginning of the base-level progress
+        self.user_name = ''
+        # number of running progress reporting generators
+        self.recur_depth = 0
+        # progress params by recursion depth
+        self.depths = {}
+        # time of the first and the last progress report
+        self.first_report_time = None
+        self.last_report_time = None
+        # monotonic time of the next progress report
+        self.next_report_time = 0.0
+        # time of the last progress report stored in db when progress is shared in memory
+        self.last_checkpoint_time = None
+        # messages of all recursion depths sent in the last bus notification
+        self.sent_msgs = None
+        # set by the cancel listener when the operation is cancelled, checked on every iteration
+        self.cancelled = False
+        # pid of the database backend of the operation
+        self.backend_pid = None
+        # ProgressInstrument by recursion depth, if the operation is instrumented
+        self.instruments = {}
+        self.lock = RLock()
+        # thread that created the state and monotonic time of the creation and of the last access
+        self.thread_id = get_ident()
+        self.created = self.last_access = monotonic()
+
+    def get_stack(self, recur_depth=None):
+        """
+        Get progress params of all recursion depths, from the top level down to a given depth
+        :param recur_depth: the deepest recursion depth, if None all recursion depths are returned
+        :return: list of progress params
+        """
+        with self.lock:
+            if recur_depth is None:
+                recur_depth = max(self.depths, default=-1)
+            return [self.depths[depth] for depth in range(recur_depth + 1) if depth in self.depths]
+
+    def get_size(self):
+        """
+        Estimate memory used by the state
+        :return: size in bytes
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.depths) + sys.getsizeof(self.sent_msgs)
+        for params in list(self.depths.values()):
+            size += sys.getsizeof(params) + sum(sys.getsizeof(value) for value in list(params.values()))
+        return size
+
+
+def get_state(code, uid=None, create=False):
+    """
+    Get in-process state of an operation
+    :param code: web progress code
+    :param uid: id of the user running the operation, used if the state is created
+    :param create: whether to create the state if it does not exist
+    :return: ProgressState or None
+    """
+    state = progress_states.get(code)
+    if state is None and create:
+        with states_lock:
+            state = progress_states.get(code)
+            if state is None:
+                state = progress_states[code] = ProgressState(code, uid)
+                if max_states and len(progress_states) > max_states:
+                    evict_states(len(progress_states) - max_states)
+        start_reaper()
+    if state is not None:
+        state.last_access = monotonic()
+    return state
+
+
+def release_state(state):
+    """
+    Forget the state of an operation if it is not in progress anymore
+    :param state: ProgressState
+    """
+    with states_lock:
+        if not state.recur_depth and not state.depths and progress_states.get(state.code) is state:
+            del progress_states[state.code]
+
+
+def configure(ttl, max_count):
+    """
+    Set bounds of the in-process states
+    :param ttl: time (in seconds) after which states not accessed are removed (0 means never)
+    :param max_count: maximal number of states (0 means no limit)
+    """
+    global state_ttl, max_states
+    state_ttl = ttl
+    max_states = max_count
+
+
+def evict_states(count):
+    """
+    Remove the least recently accessed states, the caller holds states_lock
+    :param count: number of states to remove
+    """
+    for state in sorted(progress_states.values(), key=lambda state: state.last_access)[:count]:
+        _logger.warning('Evicting progress state {} (limit of {} states reached)'.format(state.code, max_states))
+        del progress_states[state.code]
+
+
+def reap_states(ttl):
+    """
+    Remove states not accessed for the given time and states of threads that do not exist anymore
+    (e.g. of progress never reported as finished or of killed threads)
+    :param ttl: time (in seconds) after which states not accessed are removed
+    :return: number of removed states
+    """
+    thread_ids = {thread.ident for thread in enumerate_threads()}
+    time_now = monotonic()
+    with states_lock:
+        reaped = [state for state in progress_states.values()
+                  if time_now - state.last_access > ttl or state.thread_id not in thread_ids]
+        for state in reaped:
+            del progress_states[state.code]
+    for state in reaped:
+        _logger.info('Reaped progress state {} (idle for {:.0f} s)'.format(state.code, time_now - state.last_access))
+    return len(reaped)
+
+
+def start_reaper():
+    """
+    Start the reaper thread in the current process, unless it runs already or the states do not expire
+    """
+    global reaper_pid
+    if not state_ttl or reaper_pid == os.getpid():
+        return
+    with states_lock:
+        if reaper_pid == os.getpid():
+            return
+        reaper_pid = os.getpid()
+    Thread(target=reaper_loop, name='web_progress.reaper', daemon=True).start()
+
+
+def reaper_loop():
+    """
+    Remove expired states periodically
+    """
+    while True:
+        sleep(max(min(state_ttl / 10, 60), 1))
+        try:
+            reap_states(state_ttl)
+        except Exception:
+            _logger.exception('Cannot reap progress states')
+
+
+def get_states_info():
+    """
+    Describe all states for introspection
+    :return: list of dicts
+    """
+    time_now = monotonic()
+    thread_ids = {thread.ident for thread in enumerate_threads()}
+    with states_lock:
+        states = list(progress_states.values())
+    return [{
+        'code': state.code,
+        'uid': state.uid,
+        'recur_depth': state.recur_depth,
+        'depths': len(state.depths),
+        'age': round(time_now - state.created, 1),
+        'idle': round(time_now - state.last_access, 1),
+        'thread_alive': state.thread_id in thread_ids,
+        'size': state.get_size(),
+    } for state in states]
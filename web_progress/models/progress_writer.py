@@ -0,0 +1,134 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo import api, registry, SUPERUSER_ID
+from collections import OrderedDict, defaultdict
+from threading import Condition, Lock, Thread, current_thread
+import logging
+import os
+
+_logger = logging.getLogger(__name__)
+
+
+class ProgressWriter(Thread):
+    """
+    Background writer of progress reports.
+    There is one writer per database in every server process. Reports are queued in a bounded buffer
+    and flushed in bulk every flush interval using one long-lived cursor.
+    Every report carries the whole recursion depth stack of an operation, so a newer report of an operation
+    replaces all the buffered reports (of every recursion depth) of the same code.
+    """
+    writers = {}
+    writers_lock = Lock()
+
+    def __init__(self, dbname, interval, size):
+        super(ProgressWriter, self).__init__(name='web_progress.writer.{}'.format(dbname), daemon=True)
+        self.dbname = dbname
+        self.interval = interval
+        self.size = size
+        self.pid = os.getpid()
+        # code -> (uid, vals_list), ordered by arrival of the last report
+        self.pending = OrderedDict()
+        self.condition = Condition()
+        # held while buffered reports are being written
+        self.flush_lock = Lock()
+        self.cr = None
+
+    @classmethod
+    def get(cls, dbname, interval, size):
+        """
+        Get the writer of the current process for a given database, start it if necessary
+        :param dbname: database name
+        :param interval: flush interval (in seconds)
+        :param size: maximal number of buffered operations
+        :return: ProgressWriter
+        """
+        with cls.writers_lock:
+            writer = cls.get_running(dbname)
+            if not writer:
+                # a writer inherited from the parent process (prefork) does not run in this process
+                writer = cls.writers[dbname] = cls(dbname, interval, size)
+                writer.start()
+        return writer
+
+    @classmethod
+    def get_running(cls, dbname):
+        """
+        Get the running writer of the current process for a given database
+        :param dbname: database name
+        :return: ProgressWriter or None
+        """
+        writer = cls.writers.get(dbname)
+        if writer and writer.pid == os.getpid() and writer.is_alive():
+            return writer
+        return None
+
+    def put(self, uid, vals_list):
+        """
+        Buffer progress report
+        :param uid: id of the user reporting progress
+        :param vals_list: list of web.progress creation vals of one operation
+        :return: (bool) False if the buffer is full and the report has to be stored synchronously
+        """
+        code = vals_list[0].get('code')
+        with self.condition:
+            if code not in self.pending and len(self.pending) >= self.size:
+                return False
+            self.pending.pop(code, None)
+            self.pending[code] = (uid, vals_list)
+        return True
+
+    def discard(self, code):
+        """
+        Forget buffered reports of an operation
+        :param code: web progress code
+        """
+        with self.condition:
+            self.pending.pop(code, None)
+
+    def flush(self):
+        """
+        Store all buffered reports in one transaction
+        """
+        with self.flush_lock:
+            with self.condition:
+                pending, self.pending = self.pending, OrderedDict()
+            if not pending:
+                return
+            vals_by_uid = defaultdict(list)
+            for uid, vals_list in pending.values():
+                vals_by_uid[uid] += vals_list
+            if not self.cr:
+                self.cr = registry(self.dbname).cursor()
+            try:
+                for uid, vals_list in vals_by_uid.items():
+                    env = api.Environment(self.cr, uid, {})
+                    env['web.progress']._store_progress(vals_list, notify=False)
+                # one bus notification per channel for all reports of the flush
+                env = api.Environment(self.cr, SUPERUSER_ID, {})
+                env['web.progress']._notify_progress(sum(vals_by_uid.values(), []))
+                self.cr.commit()
+            except Exception:
+                # the connection may be broken, open a new one on the next flush
+                self.close()
+                raise
+
+    def close(self):
+        """
+        Close the cursor of the writer
+        """
+        if self.cr:
+            try:
+                self.cr.rollback()
+                self.cr.close()
+            except Exception:
+                pass
+            self.cr = None
+
+    def run(self):
+        current_thread().dbname = self.dbname
+        while True:
+            with self.condition:
+                self.condition.wait(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                _logger.exception("Progress writer of database {} failed to store progress".format(self.dbname))
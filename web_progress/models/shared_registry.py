@@ -0,0 +1,161 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo.tools import config
+from contextlib import contextmanager
+from threading import Lock
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+_logger = logging.getLogger(__name__)
+
+
+class SharedProgressRegistry(object):
+    """
+    Progress registry shared by all server processes of a host.
+    It is a memory mapped file divided into fixed-size slots, one slot per operation (code).
+    A slot holds the latest progress (the list of progress vals of all recursion depths) serialized in JSON.
+    Writers lock the whole file, readers do not lock at all: every slot starts with a sequence number
+    which is odd while the slot is being written (seqlock), so readers retry on concurrent writes.
+    """
+    # sequence number, time of update, final flag, code, payload length
+    header = struct.Struct('<IdB40sH')
+    # number of slots probed for a given code
+    probe = 32
+    registries = {}
+    registries_lock = Lock()
+
+    def __init__(self, path, slots, slot_size, ttl, final_ttl):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ttl = ttl
+        self.final_ttl = final_ttl
+        self.pid = os.getpid()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = slots * slot_size
+        with self._locked():
+            if os.fstat(self.fd).st_size < size:
+                os.ftruncate(self.fd, size)
+        self.mm = mmap.mmap(self.fd, size)
+
+    @classmethod
+    def get(cls, dbname, slots, slot_size, ttl, final_ttl):
+        """
+        Get the registry of a given database, (re)open it in every process
+        (the file lock of a registry inherited from the parent process would be shared with the parent)
+        :param dbname: database name
+        :param slots: number of slots
+        :param slot_size: size of a slot in bytes
+        :param ttl: time (in seconds) after which a slot of an ongoing operation may be reused
+        :param final_ttl: time (in seconds) after which a slot of a finished operation may be reused
+        :return: SharedProgressRegistry
+        """
+        with cls.registries_lock:
+            shared = cls.registries.get(dbname)
+            if not shared or shared.pid != os.getpid():
+                shm_dir = os.path.isdir('/dev/shm') and '/dev/shm' or tempfile.gettempdir()
+                # databases of the same name of other server instances of the host have their own registries
+                instance = hashlib.sha1('{}:{}'.format(config['data_dir'], config['http_port']).encode()).hexdigest()
+                path = os.path.join(shm_dir, 'odoo_web_progress_{}_{}.shm'.format(instance[:8], dbname))
+                shared = cls.registries[dbname] = cls(path, slots, slot_size, ttl, final_ttl)
+        return shared
+
+    @contextmanager
+    def _locked(self):
+        """
+        Lock the registry file for writing (exclusive among processes)
+        """
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _slot_offsets(self, code):
+        """
+        Offsets of slots probed for a given code
+        """
+        start = zlib.crc32(code.encode())
+        return [((start + idx) % self.slots) * self.slot_size for idx in range(min(self.probe, self.slots))]
+
+    def write(self, code, progress_list, final=False):
+        """
+        Write progress of an operation
+        :param code: web progress code
+        :param progress_list: list of progress vals of all recursion depths
+        :param final: whether the operation is finished (done or cancelled)
+        :return: (bool) True if written, False if the payload is too big or there is no free slot
+        """
+        code_bytes = code.encode()
+        payload = json.dumps(progress_list, separators=(',', ':')).encode()
+        if len(code_bytes) > 40:
+            return False
+        if len(payload) > self.slot_size - self.header.size:
+            _logger.debug("Progress {} does not fit into a shared registry slot".format(code))
+            # older progress of the operation shall not be read anymore
+            self.discard(code)
+            return False
+        now = time.time()
+        with self._locked():
+            offset = None
+            for slot_offset in self._slot_offsets(code):
+                seq, updated, slot_final, slot_code, length = self.header.unpack_from(self.mm, slot_offset)
+                slot_code = slot_code.rstrip(b'\0')
+                if slot_code == code_bytes:
+                    offset = slot_offset
+                    break
+                if offset is None and (not slot_code or
+                                       updated < now - (slot_final and self.final_ttl or self.ttl)):
+                    offset = slot_offset
+            if offset is None:
+                return False
+            seq = self.header.unpack_from(self.mm, offset)[0]
+            # odd sequence number, the slot is being written
+            struct.pack_into('<I', self.mm, offset, (seq + 1) & 0xffffffff)
+            self.mm[offset + self.header.size:offset + self.header.size + len(payload)] = payload
+            self.header.pack_into(self.mm, offset, (seq + 2) & 0xffffffff, now, final, code_bytes, len(payload))
+        return True
+
+    def discard(self, code):
+        """
+        Free the slot of an operation
+        :param code: web progress code
+        """
+        code_bytes = code.encode()
+        with self._locked():
+            for slot_offset in self._slot_offsets(code):
+                seq, updated, slot_final, slot_code, length = self.header.unpack_from(self.mm, slot_offset)
+                if slot_code.rstrip(b'\0') == code_bytes:
+                    self.header.pack_into(self.mm, slot_offset, (seq + 2) & 0xffffffff, 0.0, False, b'', 0)
+                    break
+
+    def read(self, code, retries=5):
+        """
+        Read progress of an operation
+        :param code: web progress code
+        :param retries: number of retries on concurrent write
+        :return: list of progress vals of all recursion depths or None if the operation is not registered
+        """
+        code_bytes = code.encode()
+        for offset in self._slot_offsets(code):
+            for retry in range(retries):
+                seq, updated, final, slot_code, length = self.header.unpack_from(self.mm, offset)
+                if seq % 2:
+                    continue
+                if slot_code.rstrip(b'\0') != code_bytes:
+                    break
+                if not final and updated < time.time() - self.ttl:
+                    # abandoned by a dead process
+                    return None
+                payload = self.mm[offset + self.header.size:offset + self.header.size + length]
+                if self.header.unpack_from(self.mm, offset)[0] != seq:
+                    continue
+                return json.loads(payload)
+        return None
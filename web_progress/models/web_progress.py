@@ -1,38 +1,58 @@
 # Part of web_progress. See LICENSE file for full copyright and licensing details.
 from odoo import models, api, registry, fields, _, SUPERUSER_ID
-from odoo.exceptions import UserError
-from threading import RLock
+from odoo.exceptions import AccessError, UserError
+from odoo.tools import config, str2bool, sql
+from odoo.service.server import memory_info
+from werkzeug.urls import url_decode
+from psycopg2.extras import execute_values
 from datetime import datetime, timedelta
+from time import monotonic
 from collections import defaultdict
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 import html
 import odoo
+import os
 import json
 import logging
+import psutil
+from .cancel_listener import CancelListener
+from .progress_instrument import ProgressInstrument, instrument_iter, excluded
+from .progress_writer import ProgressWriter
+from .shared_registry import SharedProgressRegistry
+from .progress_state import get_state, release_state, configure, get_states_info, reap_states
 
 _logger = logging.getLogger(__name__)
-lock = RLock()
-# track time between progress reports
-last_report_time = {}
-# track time from the beginnig
-first_report_time = {}
-# store recursion depth for every operation
-recur_depths = {}
-# progress reports data
-progress_data = defaultdict(dict)
-# user name
-user_name = {}
 
 
 def json_dump(v):
     return json.dumps(v, separators=(',', ':'))
 
 
+def get_config(key, default):
+    """
+    Get web_progress option from the server configuration file, e.g. web_progress_async = True
+    :param key: option name
+    :param default: default value, its type is used to convert the configured value
+    :return: option value
+    """
+    value = config.get(key)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return str2bool(value)
+    return type(default)(value)
+
+
 class CancelledProgress(models.UserError):
     # exception used to cancel the execution
     pass
 
 
+class BackgroundProgress(CancelledProgress):
+    # exception used to cancel the execution of an operation moved to background
+    pass
+
+
 class RestoreEnvToComputeToWrite(Exception):
     """
     Used to restore the towrite and to compute of an old env
@@ -44,6 +64,53 @@ class WebProgress(models.TransientModel):
     _transient_max_hours = 0.5
     # time between progress reports (in seconds)
     _progress_period_secs = 5
+    # store ongoing progress reports in a background writer
+    _progress_async = get_config('web_progress_async', False)
+    # time between flushes of the background writer (in seconds)
+    _progress_flush_secs = get_config('web_progress_flush_secs', 1.0)
+    # maximal number of operations buffered by the background writer
+    _progress_queue_size = get_config('web_progress_queue_size', 1000)
+    # keep one record per code and recursion depth, updated in place
+    _progress_upsert = get_config('web_progress_upsert', False)
+    # time between samples of progress history kept in upsert mode (in seconds, 0 means no history)
+    _progress_history_secs = get_config('web_progress_history_secs', 0)
+    # share progress among server processes of a host in a memory mapped file
+    _progress_shm = get_config('web_progress_shm', False)
+    # number and size (in bytes) of slots of the shared progress registry
+    _progress_shm_slots = get_config('web_progress_shm_slots', 512)
+    _progress_shm_slot_size = get_config('web_progress_shm_slot_size', 4096)
+    # time between progress reports stored in db when progress is shared in memory (in seconds)
+    _progress_checkpoint_secs = get_config('web_progress_checkpoint_secs', 60)
+    # target time (in seconds) and memory growth (in MB) of one batch of adaptive batch iteration
+    _progress_batch_secs = get_config('web_progress_batch_secs', 1.0)
+    _progress_batch_memory_mb = get_config('web_progress_batch_memory_mb', 64)
+    # write CSV/XLSX exports into a temporary file batch by batch and stream the file back
+    _progress_stream_export = get_config('web_progress_stream_export', False)
+    # number of imported records created at once (0 means all records at the end of the import)
+    _progress_import_batch_size = get_config('web_progress_import_batch_size', 0)
+    # number of parsed import files kept in memory of every server process
+    _progress_import_cache_size = get_config('web_progress_import_cache_size', 0)
+    # number of PDF report chunks rendered in parallel in /report/download (0 means no parallel rendering)
+    _progress_report_workers = get_config('web_progress_report_workers', 0)
+    _progress_report_chunk_size = get_config('web_progress_report_chunk_size', 100)
+    # keep run history of crons (web.progress.cron.run) for the given number of days (0 means no history)
+    _progress_cron_history_days = get_config('web_progress_cron_history_days', 30)
+    # a cron run is slow if it takes more than the given factor times the median of the previous runs
+    _progress_cron_slow_factor = get_config('web_progress_cron_slow_factor', 2.0)
+    _progress_cron_median_runs = get_config('web_progress_cron_median_runs', 20)
+    # in-process progress states not accessed for the given time (in seconds) are removed (0 means never)
+    _progress_state_ttl = get_config('web_progress_state_ttl', 21600)
+    # maximal number of in-process progress states (0 means no limit)
+    _progress_state_max = get_config('web_progress_state_max', 10000)
+    # deliver cancel requests to running operations at once by PostgreSQL notifications
+    _progress_push_cancel = get_config('web_progress_push_cancel', False)
+    # with push cancel, cancel also the SQL statement running for the cancelled operation
+    _progress_cancel_backend = get_config('web_progress_cancel_backend', True)
+    # measure SQL queries, SQL time and Python time of every element of all operations
+    # (operations may be instrumented also by progress_instrument=True in context)
+    _progress_instrument = get_config('web_progress_instrument', False)
+    # number of the slowest elements of every recursion depth reported by instrumentation
+    _progress_instrument_top = get_config('web_progress_instrument_top', 5)
 
     msg = fields.Char("Message")
     code = fields.Char("Code", required=True, index=True)
@@ -60,6 +127,26 @@ class WebProgress(models.TransientModel):
                               ('cancel', "Cancelled"),
                               ], "State")
     cancellable = fields.Boolean("Cancellable")
+    instrumentation = fields.Text("Instrumentation")
+
+    def init(self):
+        self._init_progress_index(self._progress_upsert)
+
+    def _init_progress_index(self, upsert):
+        """
+        Create (upsert mode) or drop the unique index on code and recursion depth
+        :param upsert: whether upsert mode is enabled
+        """
+        index_name = 'web_progress_code_recur_depth_uniq'
+        if upsert:
+            # keep only the newest record of every code and recursion depth
+            self.env.cr.execute("""
+            DELETE FROM web_progress old USING web_progress new
+            WHERE old.code = new.code AND old.recur_depth = new.recur_depth AND old.id < new.id
+            """)
+            sql.create_unique_index(self.env.cr, index_name, self._table, ['code', 'recur_depth'])
+        else:
+            sql.drop_index(self.env.cr, index_name, self._table)
 
     #
     # Called by web client
@@ -76,7 +163,104 @@ class WebProgress(models.TransientModel):
             'state': 'cancel',
         }
         _logger.info('Cancelling progress {}'.format(code))
+        # the permission is checked before the cancel record of the current user is created
+        push = self._progress_push_cancel and self._may_cancel(code)
         self._create_progress([vals], notify=False)
+        if push:
+            CancelListener.notify(self.env.cr.dbname, code)
+
+    @api.model
+    def _may_cancel(self, code):
+        """
+        Check if the current user may cancel the operation, i.e. the user runs it or is a progress admin
+        :param code: web progress code
+        """
+        if self.is_progress_admin():
+            return True
+        self.env.cr.execute("""
+        SELECT 1 FROM web_progress
+        WHERE code = %s AND recur_depth = 0 AND create_uid = %s AND state != 'cancel'
+        LIMIT 1
+        """, (code, self.env.uid))
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def move_to_background(self, code, kind, params):
+        """
+        Move an ongoing operation to background: the operation is cancelled and its call is repeated
+        by a background job, the result of which is sent to the user by a bus notification
+        :param code: web progress code of the operation
+        :param kind: call_kw (params are model, method, args and kwargs of the call)
+            or report (params are data and context of /report/download)
+        :param params: dict of parameters of the call
+        :return: (str) web progress code of the background job
+        """
+        if not self._may_cancel(code):
+            raise UserError(_("You are not allowed to move this operation to background"))
+        progress = self.get_progress_rpc(code)
+        if progress[0]['state'] != 'ongoing' or not all(vals['cancellable'] for vals in progress):
+            # the operation would not be cancelled, so its call would be run twice
+            raise UserError(_("This operation cannot be moved to background"))
+        if kind == 'report':
+            params = self._parse_report_download(params)
+        elif kind != 'call_kw':
+            raise UserError(_("This operation cannot be moved to background"))
+        elif params.get('model') == 'base_import.import' and params.get('method') == 'execute_import':
+            # the web client imports a file by batches, the rest of the file is imported at once
+            args = params.get('args') or []
+            options = len(args) > 3 and args[3] or (params.get('kwargs') or {}).get('options') or {}
+            options.pop('limit', None)
+        # the job runs as the user running the operation, also if moved by a progress admin
+        job_code = self.env['web.progress.job']._create_job(code, kind, params, uid=progress[0]['uid'])
+        _logger.info('Moving progress {} to background as {}'.format(code, job_code))
+        self.cancel_progress(code)
+        return job_code
+
+    @api.model
+    def _parse_report_download(self, params):
+        """
+        Get report name, record ids and data from parameters of /report/download
+        :param params: dict with data (JSON list of report URL and report type) and context
+        :return: dict of report_name, docids, data and context
+        """
+        url, report_type = json.loads(params['data'])[:2]
+        if report_type not in ('qweb-pdf', 'qweb-text'):
+            raise UserError(_("This operation cannot be moved to background"))
+        pattern = report_type == 'qweb-pdf' and '/report/pdf/' or '/report/text/'
+        report_name, _sep, query = url.split(pattern)[1].partition('?')
+        docids = None
+        data = None
+        if '/' in report_name:
+            report_name, docids = report_name.split('/')
+            docids = [int(docid) for docid in docids.split(',') if docid]
+        elif query:
+            data = dict(url_decode(query).items())
+            if 'options' in data:
+                data['options'] = json.loads(data['options'])
+            if 'context' in data:
+                data['context'] = json.loads(data['context'])
+        context = dict(json.loads(params.get('context') or '{}'), **(data or {}).get('context', {}))
+        return dict(report_name=report_name, docids=docids, data=data, context=context)
+
+    @api.model
+    def get_progress_states(self, reap=False):
+        """
+        List in-process progress states of the current server process, for progress admins only
+        :param reap: whether to remove expired states first
+        :return: dict with the number of states, their total size (in bytes) and the list of states
+            (code, uid, recursion depth, age and idle time in seconds, size in bytes)
+        """
+        if not self.is_progress_admin():
+            raise AccessError(_("Only progress admins can list progress states"))
+        if reap:
+            reap_states(self._progress_state_ttl)
+        states = get_states_info()
+        return {
+            'pid': os.getpid(),
+            'count': len(states),
+            'size': sum(state['size'] for state in states),
+            'states': states,
+        }
 
     @api.model
     def get_user_name(self, code):
@@ -86,9 +270,9 @@ class WebProgress(models.TransientModel):
         :param user_id: (int) ID of res.users record
         :return: (str) User Name
         """
-        with lock:
-            # use cached user name
-            return user_name.get(code, '')
+        # use cached user name
+        state = get_state(code)
+        return state and state.user_name or ''
 
     @api.model
     def get_progress_rpc(self, code=None):
@@ -96,6 +280,10 @@ class WebProgress(models.TransientModel):
         External call to get progress for given code
         :param code: web progress code
         """
+        shared = self._get_shared_registry()
+        progress = shared and code and shared.read(code)
+        if progress:
+            return progress
         with registry(self.env.cr.dbname).cursor() as new_cr:
             # Create a new environment with new cursor database
             new_env = api.Environment(new_cr, self.env.uid, self.env.context)
@@ -103,45 +291,119 @@ class WebProgress(models.TransientModel):
             progress_obj = self.with_env(new_env)
             return progress_obj.get_progress(code)
 
+    @api.model
+    def get_progress_multi_rpc(self, codes=None):
+        """
+        External call to get progress for many codes at once
+        :param codes: list of web progress codes
+        """
+        result = {}
+        shared = self._get_shared_registry()
+        if shared:
+            for code in codes or []:
+                progress = shared.read(code)
+                if progress:
+                    result[code] = progress
+        codes = [code for code in codes or [] if code not in result]
+        if codes:
+            with registry(self.env.cr.dbname).cursor() as new_cr:
+                # Create a new environment with new cursor database
+                new_env = api.Environment(new_cr, self.env.uid, self.env.context)
+                # with_env replace original env for this method
+                progress_obj = self.with_env(new_env)
+                result.update(progress_obj.get_progress_multi(codes))
+        return result
+
     @api.model
     def get_progress(self, code=None, recur_depth=None):
         """
         Get progress for given code
         :param code: web progress code
         :param recur_depth: recursion depth
+        :return: list of progress vals, one for every recursion depth
+        """
+        result = code and self.get_progress_multi([code], recur_depth=recur_depth).get(code)
+        return result or [self._get_progress_vals({})]
+
+    @api.model
+    def get_progress_multi(self, codes=None, recur_depth=None):
+        """
+        Get progress for given codes using a single query
+        :param codes: list of web progress codes
+        :param recur_depth: recursion depth, if given only progress of this depth is returned
+        :return: dict of lists of progress vals (one for every recursion depth) per code
         """
-        result = []
-        domain = []
+        if not codes:
+            return {}
+        self.check_access_rights('read')
+        query = """
+        SELECT DISTINCT ON (p.code, p.recur_depth)
+               p.code, p.recur_depth, p.msg, p.progress, p.progress_total, p.done, p.total, p.time_left,
+               p.time_total, p.time_elapsed, p.state, p.cancellable, p.create_uid, p.write_date,
+               partner.name AS user
+        FROM web_progress p
+        LEFT JOIN res_users u ON u.id = p.create_uid
+        LEFT JOIN res_partner partner ON partner.id = u.partner_id
+        WHERE p.code IN %s {recur_depth}
+        ORDER BY p.code, p.recur_depth, p.write_date DESC, p.id DESC
+        """.format(recur_depth=recur_depth is not None and "AND p.recur_depth = %s" or '')
+        params = [tuple(codes)]
         if recur_depth is not None:
-            domain.append(('recur_depth', '=', recur_depth))
-        if code:
-            domain.append(('code', '=', code))
-        if domain:
-            progress_id = self.search(domain, order='create_date DESC,recur_depth DESC', limit=1)
-        else:
-            progress_id = self.env[self._name]
-        # check progress of parent operations
-        if recur_depth is None and progress_id.recur_depth:
-            for parent_depth in range(progress_id.recur_depth):
-                result += self.get_progress(code, recur_depth=parent_depth)
-        progress_vals = {
-            'msg': html.escape(progress_id.msg or ''),
-            'code': progress_id.code,
-            'progress': progress_id.progress,
-            'progress_total': progress_id.progress_total,
-            'done': progress_id.done,
-            'total': progress_id.total,
-            'time_left': progress_id.time_left,
-            'time_total': progress_id.time_total,
-            'time_elapsed': progress_id.time_elapsed,
-            'state': progress_id.state,
-            'cancellable': progress_id.cancellable,
-            'uid': progress_id.create_uid.id,
-            'user': self.get_user_name(code) or progress_id.create_uid.name,
+            params.append(recur_depth)
+        self.env.cr.execute(query, params)
+        rows_by_code = defaultdict(list)
+        for row in self.env.cr.dictfetchall():
+            rows_by_code[row['code']].append(row)
+        result = {}
+        for code, rows in rows_by_code.items():
+            # the most recent report determines the current recursion depth of the operation,
+            # rows of deeper levels belong to sub-operations that are already finished
+            top_row = max(rows, key=lambda row: (row['write_date'], row['recur_depth']))
+            result[code] = [self._get_progress_vals(row) for row in rows
+                            if row['recur_depth'] <= top_row['recur_depth']]
+        return result
+
+    @api.model
+    def _get_progress_vals(self, row):
+        """
+        Convert a row of web_progress into progress vals sent to web client
+        :param row: dict of web_progress columns and name of the user
+        :return: dict of progress vals
+        """
+        return {
+            'msg': html.escape(row.get('msg') or ''),
+            'code': row.get('code', False),
+            'progress': row.get('progress') or 0,
+            'progress_total': row.get('progress_total') or 0.0,
+            'done': row.get('done') or 0,
+            'total': row.get('total') or 0,
+            'time_left': row.get('time_left') or False,
+            'time_total': row.get('time_total') or False,
+            'time_elapsed': row.get('time_elapsed') or False,
+            'state': row.get('state') or False,
+            'cancellable': row.get('cancellable') or False,
+            'uid': row.get('create_uid') or False,
+            'user': self.get_user_name(row.get('code')) or row.get('user') or False,
         }
-        # register this operation progress
-        result.append(progress_vals)
 
+    @api.model
+    def _get_progress_memory(self, codes):
+        """
+        Get progress for given codes from memory only, i.e. from the shared progress registry
+        or from progress data of operations running in the current process
+        :param codes: list of web progress codes
+        :return: dict of lists of progress vals (one for every recursion depth) per code found in memory
+        """
+        result = {}
+        shared = self._get_shared_registry()
+        for code in codes:
+            progress = shared and shared.read(code)
+            if not progress:
+                state = get_state(code)
+                progress = state and [self._get_progress_vals(dict(params, create_uid=state.uid))
+                                      for params in state.get_stack()]
+            if progress:
+                result[code] = progress
         return result
 
     @api.model
@@ -164,10 +426,9 @@ class WebProgress(models.TransientModel):
         :return list of progress codes
         """
         query = """
-        SELECT code, array_agg(state) FROM web_progress
-        WHERE create_date > timezone('utc', now()) - INTERVAL '%s SECOND'
-              AND recur_depth = 0 {user_id}
-        GROUP BY code
+        SELECT code FROM web_progress_active
+        WHERE write_date > timezone('utc', now()) - INTERVAL '%s SECOND'
+              AND state = 'ongoing' {user_id}
         """.format(
             recency=recency or 0,
             user_id=not self.is_progress_admin() and "AND create_uid = {user_id}"
@@ -179,7 +440,7 @@ class WebProgress(models.TransientModel):
         result = self.env.cr.fetchall()
         ret = [{
             'code': r[0],
-        } for r in result if r[0] and 'cancel' not in r[1] and 'done' not in r[1]]
+        } for r in result]
         return ret
 
     #
@@ -188,7 +449,8 @@ class WebProgress(models.TransientModel):
     #
 
     @api.model
-    def _report_progress(self, data, msg='', total=None, cancellable=True, log_level="info"):
+    def _report_progress(self, data, msg='', total=None, cancellable=True, log_level="info", time_budget=None,
+                         memory_budget=None):
         """
         Progress reporting generator
         :param data: collection / generator to iterate onto
@@ -196,9 +458,10 @@ class WebProgress(models.TransientModel):
         :param total: provide total directly to avoid calling len on data (which fails on generators)
         :param cancellable: indicates whether the operation is cancellable
         :param log_level: log level to use when logging progress
+        :param time_budget: maximal duration of the operation in seconds
+        :param memory_budget: maximal memory of the server process in MB
         :return: yields every element of iteration
         """
-        global recur_depths
         # web progress_code typically comes from web client in call context
         code = self.env.context.get('progress_code')
         if total is None:
@@ -208,36 +471,66 @@ class WebProgress(models.TransientModel):
             for elem in data:
                 yield elem
             return
-        with lock:
-            recur_depth = self._get_recur_depth(code)
-            if recur_depth:
-                recur_depths[code] += 1
-            else:
-                recur_depths[code] = 1
+        state = get_state(code, uid=self.env.uid, create=True)
+        with state.lock:
+            recur_depth = state.recur_depth
+            state.recur_depth += 1
+        if not recur_depth:
             # cache user name at the beginning of the base-level progress
-                user_name[code] = self.env.user.name
+            state.user_name = self.env.user.name
+            if self._progress_push_cancel:
+                CancelListener.start_listener(self._progress_cancel_backend)
+                self.env.cr.execute("SELECT pg_backend_pid()")
+                state.backend_pid = self.env.cr.fetchone()[0]
         params = dict(done=0, progress=0.0, state='ongoing', code=code, total=total, msg=msg, recur_depth=recur_depth,
                           cancellable=cancellable, log_level=log_level)
-        precise_code = self._get_precise_code(params)
-        with lock:
-            progress_data[precise_code] = dict(params)
+        # budgets of this level, measured from its start and dropped with its params when it is done
+        params.update(started=monotonic(), time_budget=time_budget or 0,
+                      memory_budget=(memory_budget or 0) * 1024 * 1024)
+        with state.lock:
+            # params are shared by reference, so reports of sub-levels see the current progress of this level
+            state.depths[recur_depth] = params
+        instrument = None
+        if self._progress_instrument or self.env.context.get('progress_instrument'):
+            with state.lock:
+                # statistics of all iterations of a sub-level are accumulated
+                instrument = state.instruments.get(recur_depth)
+                if instrument is None:
+                    instrument = state.instruments[recur_depth] = ProgressInstrument(self._progress_instrument_top)
+            data = instrument_iter(data, instrument)
         try:
+            # fast path: only count elements until the time of the next report comes
             for done, rec in zip(range(total), data):
                 params['done'] = done
-                params['progress'] = round(100 * done / total, 2)
-                params['state'] = done >= total and 'done' or 'ongoing'
-                self._report_progress_do_percent(params)
+                if monotonic() >= state.next_report_time or state.cancelled:
+                    params['progress'] = round(100 * done / total, 2)
+                    with self._progress_excluded(state, recur_depth + 1):
+                        self._report_progress_do_percent(params)
                 yield rec
         finally:
+            if instrument:
+                # measure the last element
+                data.close()
             # finally record progress as finished
-            self._report_progress_done(params)
-            with lock:
-                recur_depths[code] -= 1
-                if not recur_depths[code]:
-                    del recur_depths[code]
-                    # destroy user name only at the end of the base-level progress
-                    if code in user_name:
-                        del user_name[code]
+            with self._progress_excluded(state, recur_depth):
+                self._report_progress_done(params)
+            with state.lock:
+                state.recur_depth -= 1
+            # the state (with the user name) is destroyed only at the end of the base-level progress
+            release_state(state)
+
+    def _progress_excluded(self, state, recur_depth):
+        """
+        Exclude progress reporting from elements being processed by instrumented iterations
+        :param state: ProgressState of the operation
+        :param recur_depth: number of recursion depths (from the top level) processing an element
+        :return: context manager
+        """
+        if not state.instruments:
+            return nullcontext()
+        with state.lock:
+            instruments = [state.instruments[depth] for depth in range(recur_depth) if depth in state.instruments]
+        return excluded(instruments)
 
     @api.model
     def _get_recur_depth(self, code):
@@ -246,22 +539,47 @@ class WebProgress(models.TransientModel):
         :param code: web progress code
         :return: current recursion depth
         """
-        global recur_depths
-        with lock:
-            recur_depth = recur_depths.get(code, 0)
-        return recur_depth
+        state = get_state(code)
+        return state and state.recur_depth or 0
 
     @api.model
     def _create_progress(self, vals_list, notify=True):
         """
         Create a web progress record
-        Creation uses a fresh cursor, i.e. outside the current transaction scope
+        Creation uses a fresh cursor, i.e. outside the current transaction scope.
+        Ongoing progress is handed over to the background writer if enabled,
+        final states (done, cancel) are always stored immediately.
         :param vals: list of creation vals
         :return: None
         """
         if not vals_list:
             return
         code = vals_list[0].get('code')
+        # the first vals are those of the top-level operation
+        final = not notify or vals_list[0].get('state') in ('done', 'cancel')
+        dbname = self.env.cr.dbname
+        if self._progress_async and not final:
+            writer = ProgressWriter.get(dbname, self._progress_flush_secs, self._progress_queue_size)
+            if writer.put(self.env.uid, vals_list):
+                return
+        writer = ProgressWriter.get_running(dbname)
+        if writer and final and notify:
+            # buffered reports of this operation must not be stored after the final one
+            with writer.flush_lock:
+                writer.discard(code)
+                self._create_progress_sync(vals_list, notify=notify)
+        else:
+            self._create_progress_sync(vals_list, notify=notify)
+
+    @api.model
+    def _create_progress_sync(self, vals_list, notify=True, store=True):
+        """
+        Create a web progress record using a fresh cursor
+        :param vals: list of creation vals
+        :param store: whether to store progress records, otherwise only active operations are refreshed
+            and bus is notified
+        :return: None
+        """
         try:
             with registry(self.env.cr.dbname).cursor() as new_cr:
                 # Create a new environment with a new cursor
@@ -271,11 +589,7 @@ class WebProgress(models.TransientModel):
                 new_env.clear()
                 # with_env replaces the original env for this method
                 progress_obj = self.with_env(new_env)
-                progress_obj.create(vals_list)
-                # notify bus
-                if notify:
-                    progress_notif = progress_obj.get_progress(code)
-                    new_env['bus.bus']._sendone('web_progress', 'web_progress', progress_notif)
+                progress_obj._store_progress(vals_list, notify=notify, store=store)
                 # isolated transaction to commit
                 new_env.cr.commit()
                 # restore main transaction's data
@@ -283,6 +597,172 @@ class WebProgress(models.TransientModel):
         except RestoreEnvToComputeToWrite:
             pass
 
+    @api.model
+    def _store_progress(self, vals_list, notify=True, store=True):
+        """
+        Store progress records in the current transaction and notify bus
+        :param vals_list: list of creation vals, possibly of many operations
+        :param notify: whether to notify bus about every operation
+        :param store: whether to store progress records, otherwise only active operations are refreshed
+        :return: None
+        """
+        # times in seconds are only notified
+        records_vals = [{k: v for k, v in vals.items() if k != 'time_secs'} for vals in vals_list]
+        if store and self._progress_upsert:
+            self._upsert_progress(records_vals)
+        elif store:
+            self.create(records_vals)
+        self._update_active_progress(vals_list)
+        if notify:
+            self._notify_progress(vals_list)
+
+    @api.model
+    def _notify_progress(self, vals_list):
+        """
+        Notify web clients about progress of many operations at once: one message lists all operations
+        of a user on the channel of the user (partner) and one message lists all operations on the channel
+        of progress admins (see ir.websocket)
+        :param vals_list: list of progress vals of all recursion depths, possibly of many operations
+        :return: None
+        """
+        vals_by_code = defaultdict(list)
+        for vals in vals_list:
+            vals_by_code[vals.get('code')].append(vals)
+        progress_by_uid = defaultdict(list)
+        for code, code_vals_list in vals_by_code.items():
+            state = get_state(code)
+            progress_by_uid[state and state.uid or self.env.uid].append((code_vals_list, state))
+        users = self.env['res.users'].sudo().browse(list(progress_by_uid))
+        notifications = []
+        progress_all = []
+        for user in users:
+            progress_list = [self._get_progress_compact(code_vals_list, state, user)
+                             for code_vals_list, state in progress_by_uid[user.id]]
+            progress_all += progress_list
+            if not self.is_progress_admin(user):
+                notifications.append((user.partner_id, 'web_progress', progress_list))
+        notifications.append(('web_progress_admin', 'web_progress', progress_all))
+        self.env['bus.bus']._sendmany(notifications)
+
+    @api.model
+    def _get_progress_compact(self, vals_list, state, user):
+        """
+        Convert progress vals of all recursion depths of an operation into a compact notification:
+        numbers instead of formatted strings, messages and the user name only if changed
+        since the last notification about the operation
+        :param vals_list: list of progress vals of all recursion depths of one operation
+        :param state: ProgressState of the operation or None
+        :param user: res.users running the operation
+        :return: dict of compact progress
+        """
+        top_vals = vals_list[0]
+        progress = {
+            'code': top_vals.get('code'),
+            'uid': user.id,
+            'state': top_vals.get('state'),
+            'cancellable': all(vals.get('cancellable', True) for vals in vals_list),
+            'progress_total': top_vals.get('progress_total') or 0.0,
+            # progress, done and total of every recursion depth
+            'levels': [[vals.get('progress') or 0, vals.get('done') or 0, vals.get('total') or 0]
+                       for vals in vals_list],
+            # time left, total and elapsed in seconds
+            'time': list(top_vals.get('time_secs') or [None, None, None]),
+        }
+        msgs = [html.escape(vals.get('msg') or '') for vals in vals_list]
+        if not state or state.sent_msgs != msgs:
+            progress['msgs'] = msgs
+            progress['user'] = state and state.user_name or user.name
+            if state:
+                state.sent_msgs = msgs
+        return progress
+
+    @api.model
+    def _upsert_progress(self, vals_list):
+        """
+        Insert or update progress records, keeping one record per code and recursion depth.
+        State of a cancelled operation (and the user who cancelled it) is never overwritten.
+        :param vals_list: list of creation vals
+        :return: None
+        """
+        self.check_access_rights('create')
+        vals_by_columns = defaultdict(list)
+        for vals in vals_list:
+            vals = dict(vals, recur_depth=vals.get('recur_depth') or 0)
+            vals_by_columns[tuple(sorted(vals))].append(vals)
+        for columns, rows in vals_by_columns.items():
+            updates = ['"{col}" = EXCLUDED."{col}"'.format(col=col) for col in columns
+                       if col not in ('code', 'recur_depth', 'state')]
+            for col in ('state', 'write_uid'):
+                updates.append('"{col}" = CASE WHEN web_progress.state = \'cancel\' THEN web_progress."{col}" '
+                               'ELSE EXCLUDED."{col}" END'.format(col=col))
+            query = """
+            INSERT INTO web_progress (create_uid, create_date, write_uid, write_date, {columns})
+            VALUES %s
+            ON CONFLICT (code, recur_depth) DO UPDATE SET write_date = EXCLUDED.write_date, {updates}
+            """.format(columns=', '.join('"{}"'.format(col) for col in columns),
+                       updates=', '.join(updates))
+            template = "(%s, timezone('utc', now()), %s, timezone('utc', now()), {})".format(
+                ', '.join(['%s'] * len(columns)))
+            execute_values(self.env.cr._obj, query,
+                           [[self.env.uid, self.env.uid] + [vals[col] for col in columns] for vals in rows],
+                           template=template)
+        if self._progress_history_secs:
+            self._sample_progress_history({vals['code'] for vals in vals_list})
+        self.invalidate_model()
+
+    @api.model
+    def _update_active_progress(self, vals_list):
+        """
+        Maintain the registry of active operations (web.progress.active) from top-level progress vals:
+        ongoing operations are inserted or refreshed, cancelled operations are marked
+        and done operations are removed
+        :param vals_list: list of creation vals, possibly of many operations
+        :return: None
+        """
+        states = {}
+        for vals in vals_list:
+            if not vals.get('recur_depth'):
+                states[vals.get('code')] = vals.get('state')
+        ongoing = [code for code, state in states.items() if state == 'ongoing']
+        cancelled = tuple(code for code, state in states.items() if state == 'cancel')
+        done = tuple(code for code, state in states.items() if state == 'done')
+        if ongoing:
+            # the state of a cancelled operation is kept until it is done
+            execute_values(self.env.cr._obj, """
+            INSERT INTO web_progress_active (code, state, create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (code) DO UPDATE SET write_date = EXCLUDED.write_date
+            """, [[code, self.env.uid, self.env.uid] for code in ongoing],
+                           template="(%s, 'ongoing', %s, timezone('utc', now()), %s, timezone('utc', now()))")
+        if cancelled:
+            self.env.cr.execute("""
+            UPDATE web_progress_active SET state = 'cancel', write_uid = %s, write_date = timezone('utc', now())
+            WHERE code IN %s
+            """, (self.env.uid, cancelled))
+        if done:
+            self.env.cr.execute("DELETE FROM web_progress_active WHERE code IN %s", (done,))
+
+    @api.model
+    def _sample_progress_history(self, codes):
+        """
+        Copy progress records updated in the current transaction into progress history,
+        at most once per history period, except for final states which are always copied
+        :param codes: set of web progress codes
+        :return: None
+        """
+        self.env.cr.execute("""
+        INSERT INTO web_progress_history (create_uid, create_date, write_uid, write_date, code, recur_depth,
+                                          msg, progress, progress_total, done, total, state, time_elapsed)
+        SELECT p.create_uid, p.write_date, p.write_uid, p.write_date, p.code, p.recur_depth,
+               p.msg, p.progress, p.progress_total, p.done, p.total, p.state, p.time_elapsed
+        FROM web_progress p
+        WHERE p.code IN %s AND p.write_date = timezone('utc', now())
+              AND (p.state IN ('done', 'cancel') OR NOT EXISTS (
+                SELECT 1 FROM web_progress_history h
+                WHERE h.code = p.code AND h.recur_depth = p.recur_depth
+                      AND h.create_date > timezone('utc', now()) - INTERVAL '1 SECOND' * %s))
+        """, (tuple(codes), self._progress_history_secs))
+
     @api.model
     def _check_cancelled(self, params):
         """
@@ -295,7 +775,7 @@ class WebProgress(models.TransientModel):
         with registry(self.env.cr.dbname).cursor() as new_cr:
             # use new cursor to check for cancel
             query = """
-            SELECT create_uid FROM web_progress
+            SELECT write_uid FROM web_progress
             WHERE code = %s AND state = 'cancel' AND recur_depth = 0
                 
             """
@@ -307,18 +787,73 @@ class WebProgress(models.TransientModel):
                     return user_id
         return False
 
-    def _get_parent_codes(self, params):
+    @api.model
+    def _get_default_budgets(self):
         """
-        Get list of precise codes of all parents
+        Get default time and memory budgets of operations: system parameters web_progress.time_budget (seconds)
+        and web_progress.memory_budget (MB) or, in multi-process mode, 90% of the limits of the server process
+        (limit_time_real or limit_time_real_cron and limit_memory_hard)
+        :return: (tuple) time budget in seconds and memory budget in bytes, 0 means no budget
         """
-        code = params.get('code')
-        return [code + '##' + str(d) for d in range(params.get('recur_depth'))]
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        time_budget = float(get_param('web_progress.time_budget', 0))
+        memory_budget = float(get_param('web_progress.memory_budget', 0)) * 1024 * 1024
+        if config['workers']:
+            limit_time = config['limit_time_real']
+            if self._context.get('web_progress_cron_run') and config['limit_time_real_cron'] >= 0:
+                limit_time = config['limit_time_real_cron']
+            time_budget = time_budget or 0.9 * (limit_time or 0)
+            memory_budget = memory_budget or 0.9 * (config['limit_memory_hard'] or 0)
+        return time_budget, memory_budget
 
-    def _get_precise_code(self, params):
+    def _check_budgets(self, params):
         """
-        Get precise code, i.e. progress code + recurency depth level
+        Cancel the operation if any of its running levels exceeds its time or memory budget,
+        before the server process is killed; default budgets apply to the top level
+        :param params: params of the reporting recursion depth
         """
-        return params.get('code') + '##' + str(params.get('recur_depth'))
+        stack = self._get_progress_stack(params)
+        if not stack:
+            return
+        top = stack[0]
+        if 'default_budgets' not in top:
+            top['default_budgets'] = self._get_default_budgets()
+        time_default, memory_default = top['default_budgets']
+        budgets = [(time_default, memory_default, top.get('started'))]
+        budgets += [(level.get('time_budget'), level.get('memory_budget'), level.get('started')) for level in stack]
+        time_now = monotonic()
+        for time_budget, _memory_budget, started in budgets:
+            if time_budget and started and time_now - started > time_budget:
+                raise CancelledProgress(_("Operation has been cancelled, because it has been running for more than "
+                                          "{:.0f} seconds. Please split it into smaller parts.").format(time_budget))
+        memory_budget = min((budget[1] for budget in budgets if budget[1]), default=0)
+        if memory_budget:
+            memory = memory_info(psutil.Process(os.getpid()))
+            if memory > memory_budget:
+                raise CancelledProgress(_("Operation has been cancelled, because it uses more than {:.0f} MB "
+                                          "of memory. Please split it into smaller parts.").format(
+                    memory_budget / 1024 / 1024))
+
+    @api.model
+    def _raise_cancelled(self, code, user_id):
+        """
+        Raise CancelledProgress, or BackgroundProgress if the operation was moved to background,
+        in which case its job is run once this operation is rolled back
+        :param code: web progress code
+        :param user_id: (recordset) res.users of the user that cancelled the operation
+        """
+        if self.env['web.progress.job']._activate_job(code):
+            raise BackgroundProgress(_("Operation has been moved to background"))
+        raise CancelledProgress(_("Operation has been cancelled by") + " " + user_id.sudo().name)
+
+    def _get_progress_stack(self, params):
+        """
+        Get progress params of all parents and of the given recursion depth
+        :param params: params to identify code and depth
+        :return: list of progress params
+        """
+        state = get_state(params.get('code'))
+        return state and state.get_stack(params.get('recur_depth')) or []
 
     def _format_time(self, seconds):
         """
@@ -337,37 +872,32 @@ class WebProgress(models.TransientModel):
         :param params: params of progress
         :param time_now: datetime of now
         :param first_ts: datetime of first progress report
-        :return: (pair of str) time left in h:mm:ss format and time total of operation
+        :return: (list of int) seconds of time left, time total and elapsed time of operation, None if unknown
         """
-        time_left = ''
-        time_total = ''
-        time_elapsed = ''
+        time_left = None
+        time_total = None
+        time_elapsed = None
         if first_ts:
             pogress_total = params.get('progress_total', 0)
             if pogress_total > 0:
                 time_per_percent = (time_now - first_ts) / pogress_total
                 progress_left = 100.0 - pogress_total
-                time_left = self._format_time(progress_left * time_per_percent.total_seconds())
-                time_total = self._format_time(100.0 * time_per_percent.total_seconds())
-                time_elapsed = self._format_time((time_now - first_ts).total_seconds())
-        return time_left, time_total, time_elapsed
+                time_left = int(progress_left * time_per_percent.total_seconds())
+                time_total = int(100.0 * time_per_percent.total_seconds())
+                time_elapsed = int((time_now - first_ts).total_seconds())
+        return [time_left, time_total, time_elapsed]
 
     def _get_progress_total(self, params):
         """
         Get total progress taking into account all progress recur depths
         :return: (float) real progress
         """
-        global progress_data
-        codes = self._get_parent_codes(params)
-        codes.append(self._get_precise_code(params))
         progress_total = 0.0
         progress_depth = 100.0
-        for precise_code in codes:
-            with lock:
-                params_prec = progress_data.get(precise_code)
+        for params_prec in self._get_progress_stack(params):
             if not params_prec or 'done' not in params_prec or 'total' not in params_prec or params_prec['total'] == 0:
                 continue
-            progress_total += float(params_prec['progress']) * progress_depth / 100
+            progress_total += float(params_prec['done']) / params_prec['total'] * progress_depth
             progress_depth /= params_prec['total']
         return progress_total
 
@@ -378,14 +908,9 @@ class WebProgress(models.TransientModel):
         :param attrib: name of attribute to change
         :param value: value of attribute to change
         """
-        global progress_data
-        codes = self._get_parent_codes(params)
-        codes.append(self._get_precise_code(params))
-        with lock:
-            params[attrib] = value
-            with lock:
-                for precise_code in codes:
-                    progress_data[precise_code][attrib] = value
+        params[attrib] = value
+        for params_prec in self._get_progress_stack(params):
+            params_prec[attrib] = value
 
     def _report_progress_do_percent(self, params):
         """
@@ -400,37 +925,37 @@ class WebProgress(models.TransientModel):
         :return: None
         """
         # check the time from last progress report
-        global last_report_time, first_report_time, progress_data
-        code = params.get('code')
-        precise_code = self._get_precise_code(params)
+        state = get_state(params.get('code'), uid=self.env.uid, create=True)
         time_now = datetime.now()
-        with lock:
-            first_ts = first_report_time.get(code)
+        with state.lock:
+            first_ts = state.first_report_time
             if not first_ts:
-                first_report_time[code] = time_now
-            last_ts = last_report_time.get(code)
+                state.first_report_time = time_now
+            last_ts = state.last_report_time
             if not last_ts:
                 last_ts = (time_now - timedelta(seconds=self._progress_period_secs + 1))
-            progress_data[precise_code] = dict(params)
+            state.depths[params.get('recur_depth')] = params
             progress_total = self._get_progress_total(params)
             self._set_attrib_for_all(params, 'progress_total', progress_total)
         period_sec = (time_now - last_ts).total_seconds()
-        # report progress every time period
-        if period_sec >= self._progress_period_secs:
+        # report progress every time period, check at once a cancel notified by the cancel listener
+        if period_sec >= self._progress_period_secs or state.cancelled:
             if params.get('cancellable', True):
                 user_id = self._check_cancelled(params)
                 if user_id:
-                    raise CancelledProgress(_("Operation has been cancelled by") + " " + user_id.sudo().name)
-            time_left, time_total, time_elapsed = self._get_time_left(params, time_now, first_ts)
-            if time_left:
-                self._set_attrib_for_all(params, 'time_left', time_left)
-            if time_total:
-                self._set_attrib_for_all(params, 'time_total', time_total)
-            if time_elapsed:
-                self._set_attrib_for_all(params, 'time_elapsed', time_elapsed)
+                    self._raise_cancelled(params.get('code'), user_id)
+                self._check_budgets(params)
+            state.cancelled = False
+            time_secs = self._get_time_left(params, time_now, first_ts)
+            if time_secs[0] is not None:
+                # numbers are sent in compact notifications, formatted times are stored and logged
+                self._set_attrib_for_all(params, 'time_secs', time_secs)
+                for key, seconds in zip(('time_left', 'time_total', 'time_elapsed'), time_secs):
+                    self._set_attrib_for_all(params, key, self._format_time(seconds))
             self._report_progress_store(params)
-            with lock:
-                last_report_time[code] = time_now
+            with state.lock:
+                state.last_report_time = time_now
+                state.next_report_time = monotonic() + self._progress_period_secs
 
     def _report_progress_done(self, params):
         """
@@ -442,36 +967,55 @@ class WebProgress(models.TransientModel):
         :param cancellable: indicates whether the operation is cancellable
         :return:
         """
-        global progress_data
-        precise_code = self._get_precise_code(params)
+        state = get_state(params.get('code'), uid=self.env.uid, create=True)
+        recur_depth = params.get('recur_depth')
         params['progress'] = 100
         params['done'] = params['total']
         params['state'] = 'done'
-        code = params.get('code')
-        if params.get('recur_depth'):
-            # done sub-level progress, lazy report
-            ret = self._report_progress_do_percent(params)
-        else:
-            # done main-level progress, report immediately
-            progress_data[precise_code] = dict(params)
-            ret = self._report_progress_store(params)
-            with lock:
-                # remove last report time for this code
-                if code in last_report_time:
-                    del last_report_time[code]
-                if code in first_report_time:
-                    del first_report_time[code]
-        # remove data for this precise code code
-        with lock:
-            if precise_code in progress_data:
-                del progress_data[precise_code]
+        try:
+            if recur_depth:
+                # done sub-level progress, lazy report
+                ret = self._report_progress_do_percent(params)
+            else:
+                # done main-level progress, report immediately
+                if state.instruments:
+                    self._report_progress_instrumentation(params, state)
+                with state.lock:
+                    state.depths[recur_depth] = dict(params)
+                ret = self._report_progress_store(params)
+                with state.lock:
+                    # reset report times for this code
+                    state.first_report_time = None
+                    state.last_report_time = None
+                    state.last_checkpoint_time = None
+                    state.next_report_time = 0.0
+                    state.instruments = {}
+        finally:
+            # remove data for this recursion depth
+            with state.lock:
+                state.depths.pop(recur_depth, None)
+            release_state(state)
         return ret
 
+    def _report_progress_instrumentation(self, params, state):
+        """
+        Log statistics of instrumented iterations of all recursion depths and store them in the done record
+        :param params: params of the top-level progress
+        :param state: ProgressState of the operation
+        """
+        with state.lock:
+            instruments = sorted(state.instruments.items())
+        logger_cmd = getattr(_logger, params.get('log_level') or 'info', _logger.info)
+        for depth, instrument in instruments:
+            logger_cmd("Progress {code} {level} instrumentation: {stats}".format(
+                code=params.get('code'), level=">" * (depth + 1), stats=instrument.format()))
+        params['instrumentation'] = json_dump({depth: instrument.get_stats() for depth, instrument in instruments})
+
     def _report_progress_prepare_vals(self, params):
         """
-        Filter out all params that are not web.progress fields
+        Filter out all params that are not web.progress fields, except of times in seconds for notifications
         """
-        vals = {k: v for k, v in params.items() if k in self._fields}
+        vals = {k: v for k, v in params.items() if k in self._fields or k == 'time_secs'}
         return vals
 
     def _report_progress_store(self, params):
@@ -486,19 +1030,19 @@ class WebProgress(models.TransientModel):
         :param cancellable: indicates whether the operation is cancellable
         :param state: state of progress: ongoing or done
         """
-        global progress_data
-        codes = self._get_parent_codes(params)
-        codes.append(self._get_precise_code(params))
         vals_list = []
         first_line = True
-        for precise_code in codes:
-            with lock:
-                my_progress_data = progress_data.get(precise_code)
-            if not my_progress_data:
-                continue
+        state = get_state(params.get('code'))
+        for my_progress_data in self._get_progress_stack(params):
+            if my_progress_data.get('total') and my_progress_data.get('state') == 'ongoing':
+                # progress of other levels is refreshed only when reported
+                my_progress_data['progress'] = round(100 * my_progress_data['done'] / my_progress_data['total'], 2)
             log_message = "Progress {code} {level} {progress}% ({done}/{total}) {msg}".format(
                 level=(">" * (my_progress_data.get('recur_depth') + 1)),
                 **my_progress_data)
+            instrument = state and state.instruments.get(my_progress_data.get('recur_depth'))
+            if instrument and my_progress_data.get('state') == 'ongoing':
+                log_message += " [{}]".format(instrument.format())
             log_level = my_progress_data.get('log_level')
             if hasattr(_logger, log_level):
                 logger_cmd = getattr(_logger, log_level)
@@ -517,4 +1061,57 @@ class WebProgress(models.TransientModel):
             logger_cmd(log_message)
             vals_list.append(self._report_progress_prepare_vals(my_progress_data))
             first_line = False
+        run_info = self.env.context.get('web_progress_cron_run')
+        if run_info and vals_list and run_info.code == vals_list[0].get('code'):
+            run_info.sample(vals_list[0].get('done') or 0, monotonic())
+        shared = self._get_shared_registry()
+        # progress that does not fit into the shared registry is stored in db as usual
+        if shared and vals_list and self._report_progress_share(shared, vals_list):
+            if not self._is_progress_checkpoint(vals_list):
+                # only periodic checkpoints and final states are stored in db, other reports keep
+                # the operation active (listed in the systray) and notify progress bars
+                self._create_progress_sync(vals_list, store=False)
+                return
         self._create_progress(vals_list)
+
+    def _get_shared_registry(self):
+        """
+        Get the shared progress registry of the current database
+        :return: SharedProgressRegistry or None if progress is not shared in memory
+        """
+        if not self._progress_shm:
+            return None
+        # slots of finished operations are kept for a minute to let the web clients notice the end
+        return SharedProgressRegistry.get(self.env.cr.dbname, self._progress_shm_slots, self._progress_shm_slot_size,
+                                          ttl=self._transient_max_hours * 3600, final_ttl=60)
+
+    def _report_progress_share(self, shared, vals_list):
+        """
+        Write progress of all recursion depths into the shared progress registry
+        :param shared: SharedProgressRegistry
+        :param vals_list: list of web.progress vals of all recursion depths
+        :return: (bool) whether progress was written
+        """
+        progress_list = [self._get_progress_vals(dict(vals, create_uid=self.env.uid)) for vals in vals_list]
+        return shared.write(vals_list[0]['code'], progress_list,
+                            final=vals_list[0].get('state') in ('done', 'cancel'))
+
+    def _is_progress_checkpoint(self, vals_list):
+        """
+        Check if progress report shall be stored in db when progress is shared in memory:
+        the first report, reports of final states and then one report every checkpoint period
+        :param vals_list: list of web.progress vals of all recursion depths
+        :return: (bool)
+        """
+        state = get_state(vals_list[0]['code'], uid=self.env.uid, create=True)
+        time_now = datetime.now()
+        with state.lock:
+            last_ts = state.last_checkpoint_time
+            if vals_list[0].get('state') in ('done', 'cancel') or not last_ts or \
+                    (time_now - last_ts).total_seconds() >= self._progress_checkpoint_secs:
+                state.last_checkpoint_time = time_now
+                return True
+        return False
+
+
+configure(WebProgress._progress_state_ttl, WebProgress._progress_state_max)
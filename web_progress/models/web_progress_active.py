@@ -0,0 +1,24 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo import models, fields
+
+
+class WebProgressActive(models.TransientModel):
+    """
+    Registry of active (ongoing or cancelled but not yet finished) operations, one record per code.
+    Records are maintained by WebProgress._update_active_progress whenever progress is stored
+    and removed when the operation is done, so listing ongoing operations does not depend
+    on the number of progress records.
+    """
+    _name = 'web.progress.active'
+    _description = "Active Operation"
+    # operations of killed server processes are never finished, the records are vacuumed
+    _transient_max_hours = 0.5
+
+    code = fields.Char("Code", required=True)
+    state = fields.Selection([('ongoing', "Ongoing"),
+                              ('cancel', "Cancelled"),
+                              ], "State", required=True, default='ongoing')
+
+    _sql_constraints = [
+        ('code_uniq', 'unique(code)', "Operation code must be unique"),
+    ]
@@ -0,0 +1,55 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo import models, api, fields
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class WebProgressCheckpoint(models.Model):
+    """
+    Position of an iteration with checkpoint_key (see Base.web_progress_iter), so the iteration
+    is resumed after the elements already processed when it is run again.
+    A checkpoint is stored in the transaction of the iteration, so it is committed (or rolled back) together
+    with the processed elements, and it is removed once the iteration is finished.
+    """
+    _name = 'web.progress.checkpoint'
+    _description = "Operation Checkpoint"
+
+    key = fields.Char("Key", required=True, index=True)
+    position = fields.Integer("Number of processed elements")
+    last_id = fields.Integer("ID of the last processed record")
+
+    _sql_constraints = [
+        ('key_uniq', 'unique(key)', "Checkpoint key must be unique"),
+    ]
+
+    @api.model
+    def _resume(self, key, data):
+        """
+        Get (or create) the checkpoint of an iteration and the number of elements to skip
+        :param key: checkpoint key
+        :param data: collection to iterate onto
+        :return: (tuple) checkpoint record, number of elements to skip
+        """
+        checkpoint = self.sudo().search([('key', '=', key)], limit=1)
+        if not checkpoint:
+            return self.sudo().create({'key': key}), 0
+        skip = checkpoint.position
+        if isinstance(data, models.BaseModel):
+            # records may have been processed and filtered out meanwhile, so records are skipped by the last id
+            skip = checkpoint.last_id in data._ids and data._ids.index(checkpoint.last_id) + 1 or 0
+        if skip:
+            _logger.info('Resuming iteration {} after {} processed elements'.format(key, skip))
+        return checkpoint, skip
+
+    def _save(self, position, last):
+        """
+        Store the position of the iteration in the current transaction
+        :param position: number of processed elements
+        :param last: the last processed element
+        """
+        last_id = isinstance(last, models.BaseModel) and len(last._ids) == 1 and last.id or None
+        self.env.cr.execute("""
+        UPDATE web_progress_checkpoint SET position = %s, last_id = %s, write_date = timezone('utc', now())
+        WHERE id = %s
+        """, (position, last_id, self.id))
@@ -0,0 +1,133 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo import models, api, registry, fields, _
+from datetime import timedelta
+import logging
+import statistics
+
+_logger = logging.getLogger(__name__)
+
+
+class CronRunInfo(object):
+    """
+    Outcome of a cron run, filled in while the cron job runs
+    """
+    __slots__ = ('code', 'error', 'peak_rate', 'last_sample')
+
+    def __init__(self, code):
+        self.code = code
+        self.error = None
+        # highest rate of top level items between two progress reports, sampled in process
+        # (progress records may be updated in place, buffered or stored only at checkpoints)
+        self.peak_rate = 0.0
+        # number of top level items done and monotonic time of the last progress report
+        self.last_sample = None
+
+    def sample(self, done, time_now):
+        """
+        Update the peak rate from a progress report of the run
+        :param done: number of top level items done
+        :param time_now: monotonic time of the report
+        """
+        last = self.last_sample
+        if last and time_now > last[1]:
+            self.peak_rate = max(self.peak_rate, (done - last[0]) / (time_now - last[1]))
+        self.last_sample = (done, time_now)
+
+
+class WebProgressCronRun(models.Model):
+    """
+    Run history of crons, recorded from the progress of every cron job (see IrCron._callback)
+    and kept for web_progress_cron_history_days days.
+    A run is flagged as slow if it takes much longer than the median of the previous runs of the cron.
+    """
+    _name = 'web.progress.cron.run'
+    _description = "Cron Run"
+    _order = 'id desc'
+
+    cron_id = fields.Many2one('ir.cron', "Cron", index=True, ondelete='cascade')
+    name = fields.Char("Name")
+    code = fields.Char("Code")
+    start = fields.Datetime("Start")
+    duration = fields.Float("Duration (s)", group_operator='avg')
+    state = fields.Selection([('done', "Done"),
+                              ('cancel', "Cancelled"),
+                              ('failed', "Failed"),
+                              ], "State")
+    items = fields.Integer("Items", help="Number of items processed at the top level")
+    items_per_depth = fields.Char("Items per Depth",
+                                  help="Maximal number of items processed by an iteration of every recursion depth")
+    items_per_sec = fields.Float("Items/s", group_operator='avg')
+    peak_rate = fields.Float("Peak Items/s", group_operator='max',
+                             help="Highest rate of processing of top level items between two progress reports")
+    median_duration = fields.Float("Median Duration (s)", group_operator='avg',
+                                   help="Median duration of the previous successful runs of the cron")
+    slow = fields.Boolean("Slow", index=True)
+    error = fields.Text("Error")
+
+    @api.model
+    def _record_run(self, cron_id, name, code, start, duration, error=None, peak_rate=0.0):
+        """
+        Record a cron run (with a fresh cursor, so it sees all progress reports and it is kept
+        even if the cron transaction is rolled back)
+        :param cron_id: (int) ID of ir.cron record
+        :param name: name of the cron
+        :param code: web progress code of the run
+        :param start: (datetime) start of the run
+        :param duration: (float) duration of the run in seconds
+        :param error: error message if the run failed
+        :param peak_rate: highest rate of top level items between two progress reports
+        """
+        web_progress_obj = self.env['web.progress']
+        if not web_progress_obj._progress_cron_history_days:
+            return
+        try:
+            with registry(self.env.cr.dbname).cursor() as new_cr:
+                new_env = api.Environment(new_cr, self.env.uid, self.env.context)
+                vals = new_env[self._name]._get_run_vals(cron_id, code, duration)
+                vals.update(cron_id=cron_id, name=name, code=code, start=start, duration=duration,
+                            peak_rate=peak_rate)
+                if error:
+                    vals['error'] = error
+                    if vals['state'] != 'cancel':
+                        vals['state'] = 'failed'
+                new_env[self._name].sudo().create(vals)
+        except Exception:
+            _logger.exception('Cannot record run {} of cron {}'.format(code, name))
+
+    @api.model
+    def _get_run_vals(self, cron_id, code, duration):
+        """
+        Compute statistics of a cron run from its progress records and the previous runs
+        :return: dict of values of a cron run
+        """
+        cr = self.env.cr
+        web_progress_obj = self.env['web.progress']
+        cr.execute("""
+        SELECT recur_depth, max(done), bool_or(state = 'cancel') FROM web_progress
+        WHERE code = %s GROUP BY recur_depth ORDER BY recur_depth
+        """, (code,))
+        depths = cr.fetchall()
+        items = depths and depths[0][1] or 0
+        cr.execute("""
+        SELECT duration FROM web_progress_cron_run WHERE cron_id = %s AND state = 'done' ORDER BY id DESC LIMIT %s
+        """, (cron_id, web_progress_obj._progress_cron_median_runs))
+        durations = [row[0] for row in cr.fetchall()]
+        median_duration = durations and statistics.median(durations) or 0.0
+        return {
+            'state': any(row[2] for row in depths) and 'cancel' or 'done',
+            'items': items,
+            'items_per_depth': ' / '.join(str(row[1] or 0) for row in depths),
+            'items_per_sec': duration > 0 and items / duration or 0.0,
+            'median_duration': median_duration,
+            # at least 3 previous runs are needed to compare
+            'slow': len(durations) >= 3 and duration > web_progress_obj._progress_cron_slow_factor * median_duration,
+        }
+
+    @api.autovacuum
+    def _gc_cron_runs(self):
+        """
+        Remove cron runs older than web_progress_cron_history_days days
+        """
+        days = self.env['web.progress']._progress_cron_history_days
+        if days:
+            self.sudo().search([('create_date', '<', fields.Datetime.now() - timedelta(days=days))]).unlink()
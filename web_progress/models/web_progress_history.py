@@ -0,0 +1,26 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo import models, fields
+
+
+class WebProgressHistory(models.TransientModel):
+    """
+    Sampled history of progress reports, kept for auditing in upsert mode
+    (see web_progress_upsert and web_progress_history_secs options).
+    Records are copied from web.progress by WebProgress._sample_progress_history.
+    """
+    _name = 'web.progress.history'
+    _description = "Operation Progress History"
+    _transient_max_hours = 24
+
+    msg = fields.Char("Message")
+    code = fields.Char("Code", required=True, index=True)
+    recur_depth = fields.Integer("Recursion depth", default=0)
+    progress = fields.Integer("Progress")
+    progress_total = fields.Float("Progress Total")
+    done = fields.Integer("Done")
+    total = fields.Integer("Total")
+    time_elapsed = fields.Char("Elapsed Time")
+    state = fields.Selection([('ongoing', "Ongoing"),
+                              ('done', "Done"),
+                              ('cancel', "Cancelled"),
+                              ], "State")
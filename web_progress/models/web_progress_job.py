@@ -0,0 +1,178 @@
+# Part of web_progress. See LICENSE file for full copyright and licensing details.
+from odoo import models, api, registry, fields, _, SUPERUSER_ID
+from odoo.api import call_kw
+from odoo.service.model import check_method_name
+import json
+import logging
+import traceback
+import uuid
+
+_logger = logging.getLogger(__name__)
+
+
+class WebProgressJob(models.TransientModel):
+    """
+    Operation moved to background by the user (see WebProgress.move_to_background).
+    A job waits until the original operation is cancelled by BackgroundProgress, so its changes are rolled back.
+    Then the call of the operation is repeated by the cron ir_cron_web_progress_job with a new progress code,
+    so it is reported in the systray, and the result is delivered to the user by a bus notification.
+    """
+    _name = 'web.progress.job'
+    _description = "Background Operation"
+    _order = 'id'
+    _transient_max_hours = 24
+
+    name = fields.Char("Name")
+    code = fields.Char("Code", required=True, index=True)
+    origin_code = fields.Char("Original Code", index=True)
+    kind = fields.Selection([('call_kw', "Method Call"),
+                             ('report', "Report"),
+                             ], "Kind", required=True, default='call_kw')
+    params = fields.Text("Parameters")
+    state = fields.Selection([('waiting', "Waiting for Cancel"),
+                              ('pending', "Pending"),
+                              ('done', "Done"),
+                              ('failed', "Failed"),
+                              ], "State", required=True, default='waiting')
+    activation_date = fields.Datetime("Activation Date")
+    result = fields.Text("Result")
+    error = fields.Text("Error")
+    attachment_id = fields.Many2one('ir.attachment', "Attachment", ondelete='set null')
+
+    @api.model
+    def _create_job(self, origin_code, kind, params, uid=None):
+        """
+        Create a waiting job in a separate transaction, committed before the original operation is cancelled
+        :param origin_code: web progress code of the operation moved to background
+        :param kind: call_kw or report
+        :param params: dict of parameters of the call
+        :param uid: id of the user running the original operation, the job runs as this user
+        :return: (str) web progress code of the job
+        """
+        if kind == 'call_kw':
+            check_method_name(params['method'])
+            name = "{}.{}".format(params['model'], params['method'])
+        else:
+            name = _("Report")
+        code = str(uuid.uuid4())
+        with registry(self.env.cr.dbname).cursor() as new_cr:
+            new_env = api.Environment(new_cr, uid or self.env.uid, self.env.context)
+            new_env[self._name].sudo().create({
+                'name': name,
+                'code': code,
+                'origin_code': origin_code,
+                'kind': kind,
+                'params': json.dumps(params),
+            })
+        return code
+
+    @api.model
+    def _activate_job(self, code):
+        """
+        Make the waiting job of an operation moved to background pending (with a fresh cursor),
+        called once the operation is about to raise BackgroundProgress; only jobs created for the user
+        running the operation are activated
+        :param code: web progress code of the original operation
+        :return: (bool) whether the operation was moved to background
+        """
+        with registry(self.env.cr.dbname).cursor() as new_cr:
+            new_cr.execute("""
+            UPDATE web_progress_job SET state = 'pending', activation_date = timezone('utc', now())
+            WHERE origin_code = %s AND state = 'waiting' AND create_uid = %s
+            RETURNING id
+            """, (code, self.env.uid))
+            activated = bool(new_cr.fetchall())
+            if activated:
+                # the cursor of the operation is rolled back, so the cron is triggered with the fresh cursor
+                api.Environment(new_cr, SUPERUSER_ID, {}).ref('web_progress.ir_cron_web_progress_job')._trigger()
+        return activated
+
+    def _is_origin_done(self):
+        """
+        Check if the original operation was finished before the job was activated,
+        i.e. it was not cancelled and its changes may have been committed
+        """
+        self.ensure_one()
+        if not self.origin_code:
+            return False
+        self.env.cr.execute("""
+        SELECT 1 FROM web_progress
+        WHERE code = %s AND recur_depth = 0 AND state = 'done' AND write_date < %s
+        LIMIT 1
+        """, (self.origin_code, self.activation_date or self.create_date))
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def _cron_run_jobs(self, limit=100):
+        """
+        Run pending jobs one by one, every job in its own transaction (changes of a failed job are rolled back).
+        The job row stays locked while the job runs, so a job is never run twice at the same time
+        and a job of a killed server process is pending again.
+        :param limit: maximal number of jobs run by one cron call
+        """
+        for _idx in range(limit):
+            self.env.cr.execute("""
+            SELECT id FROM web_progress_job WHERE state = 'pending' ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED
+            """)
+            row = self.env.cr.fetchone()
+            if not row:
+                break
+            job = self.browse(row[0])
+            if job._is_origin_done():
+                _logger.warning('Background operation {} not run, its original operation is finished'.format(job.code))
+                job.write({'state': 'failed', 'error': _("The original operation was finished before it could be "
+                                                         "moved to background, so it is not repeated.")})
+                job._notify_job()
+                self.env.cr.commit()
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    job._run()
+            except Exception:
+                _logger.exception('Background operation {} failed'.format(job.code))
+                job.write({'state': 'failed', 'error': traceback.format_exc()})
+            job._notify_job()
+            self.env.cr.commit()
+
+    def _run(self):
+        """
+        Run the job as its creator with its own web progress code
+        """
+        self.ensure_one()
+        params = json.loads(self.params)
+        uid = self.create_uid.id
+        if self.kind == 'report':
+            context = dict(params.get('context') or {}, progress_code=self.code)
+            env = api.Environment(self.env.cr, uid, context)
+            report = env['ir.actions.report']._get_report_from_name(params['report_name'])
+            content, report_format = report._render(report.report_name, params.get('docids'),
+                                                    data=params.get('data'))
+            attachment = self.env['ir.attachment'].create({
+                'name': "{}.{}".format(report.name, report_format),
+                'raw': content,
+                'res_model': self._name,
+                'res_id': self.id,
+            })
+            self.write({'state': 'done', 'attachment_id': attachment.id})
+            return
+        kwargs = dict(params.get('kwargs') or {})
+        kwargs['context'] = dict(kwargs.get('context') or {}, progress_code=self.code)
+        env = api.Environment(self.env.cr, uid, {})
+        result = call_kw(env[params['model']], params['method'], params.get('args') or [], kwargs)
+        self.write({'state': 'done', 'result': json.dumps(result, default=str)})
+
+    def _notify_job(self):
+        """
+        Send the result of the job to its creator
+        """
+        self.ensure_one()
+        attachment = self.sudo().attachment_id
+        payload = {
+            'code': self.code,
+            'name': self.name,
+            'state': self.state,
+            'result': self.result and json.loads(self.result),
+            'url': attachment and '/web/content/{}?download=true&access_token={}'.format(
+                attachment.id, attachment.generate_access_token()[0]) or False,
+        }
+        self.env['bus.bus']._sendone(self.create_uid.partner_id, 'web_progress_job', payload)
@@ -16,6 +16,8 @@ var ajax_rpc = ajax.rpc;
 var ajax_get_file = ajax.get_file;
 var progress_codes = {};
 var rpcIdToProgressCodes = {};
+// parameters of calls that can be moved to background by progress code
+var background_params = {};
 
 function pseudoUuid(a){
     return a?(a^Math.random()*16>>a/4).toString(16):([1e7]+-1e3+-4e3+-8e3+-1e11).replace(/[018]/g,pseudoUuid)
@@ -59,6 +61,7 @@ var RelayResult = core.Class.extend(mixins.EventDispatcherMixin, {
         });
     },
     handle: function (progress_code) {
+        delete background_params[progress_code];
         if (progress_code in progress_codes) {
             delete progress_codes[progress_code];
             core.bus.trigger('rpc_progress_result', progress_code);
@@ -97,11 +100,33 @@ function genericRelayEvents(url, fct_name, params) {
         if (context && !context.progress_code) {
             context['progress_code'] = progress_code;
             progress_codes[progress_code] = new RelayRequest(url, fct_name, params, progress_code);
+            if (params.model && params.method) {
+                setBackgroundParams(progress_code, 'call_kw', {
+                    model: params.model,
+                    method: params.method,
+                    args: params.args,
+                    kwargs: params.kwargs,
+                });
+            }
         }
     }
     return params;
 }
 
+/**
+ * Remember the call of an operation, so it can be repeated in background
+ * @param {string} progress_code
+ * @param {string} kind: call_kw or report
+ * @param {Object} params: parameters of the call
+ */
+function setBackgroundParams(progress_code, kind, params) {
+    background_params[progress_code] = {kind: kind, params: params};
+}
+
+function getBackgroundParams(progress_code) {
+    return background_params[progress_code] || false;
+}
+
 function jsonRpc(url, fct_name, params, settings) {
     if (validateCall(url, fct_name, params, settings)) {
         genericRelayEvents(url, fct_name, params);
@@ -164,6 +189,8 @@ return {
     pseudo_uuid: pseudoUuid,
     validateCall: validateCall,
     findContext: findContext,
+    setBackgroundParams: setBackgroundParams,
+    getBackgroundParams: getBackgroundParams,
 }
 });
 
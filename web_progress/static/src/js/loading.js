@@ -11,6 +11,8 @@ var ProgressMenu = require('web_progress.ProgressMenu').ProgressMenu;
 
 var _t = core._t;
 var progress_timeout = require('web.progress.bar').progress_timeout;
+var ProgressPoller = require('web.progress.poller').ProgressPoller;
+var getBackgroundParams = require('web.progress.ajax').getBackgroundParams;
 
 var last_progress_code = false;
 
@@ -19,11 +21,15 @@ ProgressMenu.include({
     init: function(parent) {
         this._super(parent);
         this.progress_timers = {};
+        // all progress refreshes are polled in batches
+        this.poller = new ProgressPoller(this.processProgressResultMulti.bind(this));
+        core.bus.on('rpc_progress_destroy', this, this.forgetProgress);
         core.bus.on('rpc_progress_request', this, this.addProgress);
         core.bus.on("rpc_progress_result", this, this.removeProgress);
         core.bus.on("rpc_progress_cancel", this, this.cancelProgress);
         core.bus.on("rpc_progress_background", this, this.moveToBackground);
         core.bus.on("rpc_progress_refresh", this, this.getProgressViaRPC);
+        core.bus.on("rpc_progress_refresh_multi", this, this.getProgressMultiViaRPC);
     },
     destroy: function() {
         for (var key in this.progress_timers) {
@@ -31,6 +37,7 @@ ProgressMenu.include({
                 clearTimeout(this.progress_timers[key]);
             }
         }
+        this.poller.destroy();
         this._super();
     },
     notifyProgressCode: function (progress_code, retries = 1) {
@@ -40,30 +47,55 @@ ProgressMenu.include({
         }
     },
     getProgressViaRPC: function (progress_code) {
+        this.getProgressMultiViaRPC([progress_code]);
+    },
+    getProgressMultiViaRPC: function (progress_codes) {
         var self = this;
-        if (progress_code in this.progress_timers) {
-            clearTimeout(this.progress_timers[progress_code]);
+        _.each(progress_codes, function (progress_code) {
+            if (progress_code in self.progress_timers) {
+                clearTimeout(self.progress_timers[progress_code]);
+            }
+            self.poller.request(progress_code);
+        });
+    },
+    processProgressResultMulti: function (result_dict) {
+        var self = this;
+        _.each(result_dict, function (result_list, progress_code) {
+            self.processProgressResult(progress_code, result_list);
+        });
+    },
+    forgetProgress: function (progress_code) {
+        this.poller.forget(progress_code);
+    },
+    processProgressResult: function (progress_code, result_list) {
+        // console.debug(result_list);
+        if (result_list.length > 0) {
+            var result = result_list[0];
+            if (['ongoing', 'done'].indexOf(result.state) >= 0) {
+                core.bus.trigger('rpc_progress', result_list)
+            }
+            if (result.state === 'done') {
+                core.bus.trigger('rpc_progress_destroy', progress_code)
+            }
         }
-        this._rpc({
-                model: 'web.progress',
-                method: 'get_progress_rpc',
-                args: [progress_code]
-            }, {'shadow': true}).then(function (result_list) {
-                // console.debug(result_list);
-                if (result_list.length > 0) {
-                    var result = result_list[0];
-                    if (['ongoing', 'done'].indexOf(result.state) >= 0) {
-                        core.bus.trigger('rpc_progress', result_list)
-                    }
-                    if (result.state === 'done') {
-                        core.bus.trigger('rpc_progress_destroy', progress_code)
-                    }
-                }
-        })
     },
-    moveToBackground: function () {
-        this.count = 0;
-        // TODO: add move to background
+    moveToBackground: function (progress_code) {
+        var self = this;
+        var background = getBackgroundParams(progress_code);
+        if (!background) {
+            return;
+        }
+        this._rpc({
+            model: 'web.progress',
+            method: 'move_to_background',
+            args: [progress_code, background.kind, background.params]
+        }, {'shadow': true}).then(function () {
+            self.displayNotification({
+                title: _t("Operation moved to background"),
+                message: _t("You will be notified when the operation is finished."),
+                type: 'info',
+            });
+        });
     },
     cancelProgress: function (progress_code) {
         var self = this;
@@ -13,6 +13,7 @@ var session = require('web.session');
 var DataImport = require('base_import.import').DataImport;
 const genericRelayEvents = require('web.progress.ajax').genericRelayEvents;
 const findContext = require('web.progress.ajax').findContext;
+const getBackgroundParams = require('web.progress.ajax').getBackgroundParams;
 var localStorage = require('web.local_storage');
 
 var _t = core._t;
@@ -37,6 +38,7 @@ var ProgressBar = Widget.extend({
         this.systray = !$spin_container;
         this.cancel_html = QWeb.render('WebProgressBarCancel', {});
         this.cancel_confirm_html = QWeb.render('WebProgressBarCancelConfirm', {})
+        this.background_html = QWeb.render('WebProgressBarBackground', {});
         this.style = localStorage.getItem(this.style_localstorage_key);
         if (!session.is_system || !this.style) {
             this.style = 'standard';
@@ -49,6 +51,7 @@ var ProgressBar = Widget.extend({
         this.$progress_time_eta = this.$("#progress_time_eta");
         this.$progress_time_eta2 = this.$("#progress_time_eta2");
         this.$progress_cancel = this.$("#progress_cancel");
+        this.$progress_background = this.$("#progress_background");
         this.$progress_percent = this.$("#progress_percent");
         this.$progress_bar = this.$("#progress_bar");
         this.$progress_user = this.$("#progress_user");
@@ -162,6 +165,7 @@ var ProgressBar = Widget.extend({
         } else {
             self.$progress_cancel.html('');
         }
+        self._showBackground(cancellable);
         var animation_timeout = progress_timeout;
         var old_progress = self.$progress_bar.data('progress');
         if (! old_progress) {
@@ -222,6 +226,28 @@ var ProgressBar = Widget.extend({
             self._confirmCancel();
         });
     },
+    /**
+     * Show the button moving the operation to background (main progress bar of a known call only)
+     */
+    _showBackground: function (cancellable) {
+        var self = this;
+        if (this.systray || !cancellable || !getBackgroundParams(this.progress_code) ||
+                this.$progress_bar.data('ongoing_cancel')) {
+            this.$progress_background.html('');
+            return;
+        }
+        if (this.$progress_background.children().length) {
+            return;
+        }
+        this.$progress_background.html(this.background_html);
+        this.$progress_background.find('#progress_background_confirm').one('click', function (event) {
+            event.stopPropagation();
+            self.$progress_bar.data('ongoing_cancel', true);
+            self.$progress_background.html(_t("Moving to background..."));
+            self.$progress_cancel.html('');
+            core.bus.trigger('rpc_progress_background', self.progress_code);
+        });
+    },
     _setTimeout: function () {
         var self = this;
         if (!this.progress_timer) {
@@ -8,16 +8,36 @@ var SystrayMenu = require('web.SystrayMenu');
 var Widget = require('web.Widget');
 var ProgressBar = require('web.progress.bar').ProgressBar;
 
+var _t = core._t;
+
+/**
+ * Format number of seconds in h:mm:ss format
+ */
+function formatTime(seconds) {
+    if (seconds === null || seconds === undefined) {
+        return false;
+    }
+    var minutes = Math.floor(seconds / 60);
+    return Math.floor(minutes / 60) + ':' + String(minutes % 60).padStart(2, '0') + ':' +
+        String(seconds % 60).padStart(2, '0');
+}
+
 /**
  * Progress menu item in the systray part of the navbar
  */
 var ProgressMenu = Widget.extend({
     template:'web_progress.ProgressMenu',
     channel: 'web_progress',
-    progress_bars: [],
+    // delay (in ms) of the query of all ongoing operations, repeated requests within the delay are merged
+    refresh_delay: 1000,
     init: function(parent) {
         this._super(parent);
-        this.call('bus_service', 'addChannel', this.channel);
+        // progress bars by code, i.e. the set of ongoing operations kept up to date by bus notifications
+        this.progress_bars = {};
+        // messages and user name of every operation, notifications carry them only when they change
+        this.progress_msgs = {};
+        this._queryRecentOperationsDebounced = _.debounce(this._queryRecentOperations.bind(this),
+                                                          this.refresh_delay);
     },
     start: function () {
         core.bus.on('rpc_progress_destroy', this, this._removeProgressBar);
@@ -27,38 +47,138 @@ var ProgressMenu = Widget.extend({
             this.$el.toggleClass('hidden', !this.progressCounter);
         }
         this.call('bus_service', 'addEventListener', 'notification', this._onNotification.bind(this));
+        // notifications sent while disconnected are lost, so all ongoing operations are queried again
+        this.call('bus_service', 'addEventListener', 'reconnect', this._queryRecentOperationsDebounced);
+        // progress bars of a hidden tab may have timed out, since nothing is polled meanwhile
+        this._onVisibilityChange = this._onVisibilityChange.bind(this);
+        document.addEventListener('visibilitychange', this._onVisibilityChange);
         this._updateProgressMenu();
+        this._queryRecentOperationsDebounced();
         return this._super();
     },
 
+    destroy: function () {
+        document.removeEventListener('visibilitychange', this._onVisibilityChange);
+        this._super();
+    },
+
     // Private
     /**
-     * Iterate bus notifications
+     * Query ongoing operations again when the tab becomes visible
+     * @private
+     */
+    _onVisibilityChange: function () {
+        if (!document.hidden) {
+            this._queryRecentOperationsDebounced();
+        }
+    },
+    /**
+     * Iterate bus notifications, only progress notifications are handled
      * @private
      */
     _onNotification: function (event) {
-        const notifications = event.detail;
         var self = this;
+        _.each(event.detail, function (notification) {
+            if (notification.type === 'web_progress_job') {
+                self._handleJobNotification(notification.payload);
+            }
+        });
+        const notifications = _.filter(event.detail, function (notification) {
+            return notification.type === self.channel;
+        });
+        if (notifications.length === 0) {
+            return;
+        }
         _.each(notifications, function (notification) {
             self._handleNotification(notification);
         });
         this._updateProgressMenu();
-        this._queryRecentOperations();
     },
     /**
      * On every bus notification schedule update of all progress and pass progress message to progress bar
      * @private
      */
     _handleNotification: function(notification){
+        var self = this;
         if (this.channel && (notification.type === this.channel)) {
-            // this._setTimerProgressPreview();
-            var progress = notification.payload[0];
-            this._processProgressData(progress.code, progress.state, progress.uid);
-            if (['ongoing', 'done'].indexOf(progress.state) >= 0) {
-                core.bus.trigger('rpc_progress', notification.payload)
+            // one notification lists compact progress of many operations
+            var missing_codes = [];
+            _.each(notification.payload, function (progress) {
+                var progress_list = self._expandProgress(progress);
+                self._processProgressData(progress.code, progress.state, progress.uid);
+                if (!progress_list) {
+                    if (progress.state !== 'done') {
+                        missing_codes.push(progress.code);
+                    }
+                } else if (['ongoing', 'done'].indexOf(progress.state) >= 0) {
+                    core.bus.trigger('rpc_progress', progress_list)
+                }
+                if (progress.state === 'done') {
+                    delete self.progress_msgs[progress.code];
+                }
+            });
+            if (missing_codes.length > 0) {
+                // messages of operations followed since the middle are not known yet
+                core.bus.trigger('rpc_progress_refresh_multi', missing_codes);
             }
         }
     },
+    /**
+     * Show the result of an operation moved to background
+     * @private
+     */
+    _handleJobNotification: function(job) {
+        var self = this;
+        var buttons = [];
+        if (job.url) {
+            buttons.push({name: _t("Download"), primary: true, onClick: function () {
+                window.location = job.url;
+            }});
+        } else if (job.result && typeof job.result === 'object' && job.result.type) {
+            buttons.push({name: _t("Open"), primary: true, onClick: function () {
+                self.do_action(job.result);
+            }});
+        }
+        this.displayNotification({
+            title: job.state === 'done' ? _t("Operation finished") : _t("Operation failed"),
+            message: job.name,
+            type: job.state === 'done' ? 'success' : 'danger',
+            sticky: true,
+            buttons: buttons,
+        });
+    },
+    /**
+     * Expand compact progress of an operation into the list of progress of all recursion depths
+     * @private
+     * @returns {Array|boolean} false if messages of the operation are not known
+     */
+    _expandProgress: function(progress) {
+        if (progress.msgs) {
+            this.progress_msgs[progress.code] = {msgs: progress.msgs, user: progress.user};
+        }
+        var known = this.progress_msgs[progress.code];
+        if (!known || known.msgs.length !== progress.levels.length) {
+            return false;
+        }
+        var time = progress.time || [];
+        return _.map(progress.levels, function (level, depth) {
+            return {
+                code: progress.code,
+                msg: known.msgs[depth],
+                progress: level[0],
+                done: level[1],
+                total: level[2],
+                progress_total: progress.progress_total,
+                time_left: formatTime(time[0]),
+                time_total: formatTime(time[1]),
+                time_elapsed: formatTime(time[2]),
+                state: depth ? 'ongoing' : progress.state,
+                cancellable: progress.cancellable,
+                uid: progress.uid,
+                user: known.user,
+            };
+        });
+    },
 
     /**
      * Add progress bar
@@ -129,15 +249,15 @@ var ProgressMenu = Widget.extend({
             method: 'get_all_progress',
             args: []
         }, {'shadow': true}).then(function (codes_list) {
-            if (codes_list.length > 0) {
-                _.forEach(codes_list, function (item) {
-                    if (item.code) {
-                        var pb = self._addProgressBar(item.code);
-                        if (pb) {
-                            pb._getProgressViaRPC();
-                        }
-                    }
-                })
+            var new_codes = [];
+            _.forEach(codes_list, function (item) {
+                if (item.code && self._addProgressBar(item.code)) {
+                    new_codes.push(item.code);
+                }
+            });
+            if (new_codes.length > 0) {
+                // refresh all new progress bars in one call
+                core.bus.trigger('rpc_progress_refresh_multi', new_codes);
             }
         })
     },
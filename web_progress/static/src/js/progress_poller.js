@@ -0,0 +1,160 @@
+// Part of web_progress. See LICENSE file for full copyright and licensing details.
+odoo.define('web.progress.poller', function (require) {
+"use strict";
+
+var core = require('web.core');
+
+/**
+ * Client-side scheduler of progress polling.
+ * All operations due within a tick are polled with one GET request to /web_progress/poll (answered
+ * with 304 Not Modified if nothing changed), polling of operations whose progress does not change
+ * is backed off and nothing is polled while the browser tab is hidden.
+ */
+var ProgressPoller = core.Class.extend({
+    url: '/web_progress/poll',
+    // time (in ms) during which poll requests are collected into one batch
+    tick: 100,
+    // first and maximal delay (in ms) of polling of an operation whose progress does not change
+    min_delay: 1000,
+    max_delay: 10000,
+    // maximal number of remembered batches (with their ETag)
+    max_batches: 50,
+    init: function (callback) {
+        this.callback = callback;
+        // followed operations
+        this.codes = {};
+        // time of the next poll and the current delay by code
+        this.due = {};
+        this.delays = {};
+        // last progress (JSON) by code
+        this.last_progress = {};
+        // ETag and result by batch (comma-separated codes)
+        this.etags = {};
+        this.results = {};
+        this.timer = false;
+        this._onVisibilityChange = this._onVisibilityChange.bind(this);
+        document.addEventListener('visibilitychange', this._onVisibilityChange);
+    },
+    destroy: function () {
+        document.removeEventListener('visibilitychange', this._onVisibilityChange);
+        clearTimeout(this.timer);
+        this.timer = false;
+    },
+    /**
+     * Poll progress of an operation with the next batch, but not sooner than its current delay
+     */
+    request: function (code) {
+        this.codes[code] = true;
+        if (!(code in this.due)) {
+            this.due[code] = Date.now() + (this.delays[code] || 0);
+        }
+        this._schedule();
+    },
+    /**
+     * Forget a finished operation
+     */
+    forget: function (code) {
+        delete this.codes[code];
+        delete this.due[code];
+        delete this.delays[code];
+        delete this.last_progress[code];
+    },
+    _schedule: function () {
+        var self = this;
+        if (this.timer || document.hidden || _.isEmpty(this.due)) {
+            return;
+        }
+        var first_due = _.min(_.values(this.due));
+        this.timer = setTimeout(function () {
+            self.timer = false;
+            self._poll();
+        }, Math.max(first_due - Date.now(), this.tick));
+    },
+    _poll: function () {
+        var self = this;
+        if (document.hidden) {
+            return;
+        }
+        var now = Date.now() + this.tick;
+        var codes = _.filter(Object.keys(this.due), function (code) {
+            return self.due[code] <= now;
+        }).sort();
+        _.each(codes, function (code) {
+            delete self.due[code];
+        });
+        if (codes.length > 0) {
+            this._fetch(codes);
+        }
+        this._schedule();
+    },
+    _fetch: function (codes) {
+        var self = this;
+        var batch = codes.join(',');
+        var headers = {};
+        if (this.etags[batch]) {
+            headers['If-None-Match'] = this.etags[batch];
+        }
+        return fetch(this.url + '?codes=' + encodeURIComponent(batch), {
+            credentials: 'same-origin',
+            headers: headers,
+        }).then(function (response) {
+            if (response.status === 304) {
+                return self.results[batch];
+            }
+            if (!response.ok) {
+                throw new Error('Progress poll failed with status ' + response.status);
+            }
+            if (Object.keys(self.etags).length >= self.max_batches) {
+                self.etags = {};
+                self.results = {};
+            }
+            self.etags[batch] = response.headers.get('ETag');
+            return response.json().then(function (result) {
+                self.results[batch] = result;
+                return result;
+            });
+        }).then(function (result) {
+            self._processResult(codes, result || {});
+        }).catch(function (error) {
+            console.warn('web_progress:', error);
+            self._retry(codes);
+        });
+    },
+    /**
+     * Poll followed operations of a failed batch again, with backoff
+     */
+    _retry: function (codes) {
+        var self = this;
+        _.each(codes, function (code) {
+            if (self.codes[code]) {
+                self.delays[code] = Math.min(Math.max(2 * (self.delays[code] || 0), self.min_delay),
+                                             self.max_delay);
+                self.request(code);
+            }
+        });
+    },
+    _processResult: function (codes, result) {
+        var self = this;
+        _.each(codes, function (code) {
+            var progress = JSON.stringify(result[code] || null);
+            if (progress !== self.last_progress[code]) {
+                self.last_progress[code] = progress;
+                self.delays[code] = 0;
+            } else {
+                self.delays[code] = Math.min(Math.max(2 * (self.delays[code] || 0), self.min_delay),
+                                             self.max_delay);
+            }
+        });
+        this.callback(result);
+    },
+    _onVisibilityChange: function () {
+        if (!document.hidden) {
+            this._schedule();
+        }
+    },
+});
+
+return {
+    ProgressPoller: ProgressPoller,
+};
+});
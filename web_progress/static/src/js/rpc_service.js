@@ -26,6 +26,10 @@ function _download(options) {
             data = {'context': JSON.parse(options.data.context)};
             legacyProgressAjax.genericRelayEvents('/web/', 'call', data);
             options.data.context = JSON.stringify(data.context);
+            if (options.url === '/report/download' && data.context.progress_code) {
+                legacyProgressAjax.setBackgroundParams(data.context.progress_code, 'report',
+                    {data: options.data.data, context: options.data.context});
+            }
         } else if (options.data.data) {
             // export
             data = JSON.parse(options.data.data);
@@ -106,4 +110,11 @@ registry.category("services").add("rpc", rpcServiceProgress);
 // register the same disalog for CancelledProgress as there is for UserError
 registry .category("error_dialogs")
     .add("odoo.addons.web_progress.models.web_progress.CancelledProgress",
-        registry .category("error_dialogs").get("odoo.exceptions.UserError"))
\ No newline at end of file
+        registry .category("error_dialogs").get("odoo.exceptions.UserError"))
+
+// an operation moved to background is cancelled silently, its result is delivered by a notification
+registry.category("error_handlers").add("web_progress_background", function (env, error, originalError) {
+    const exceptionName = originalError && (originalError.exceptionName ||
+        (originalError.data && originalError.data.name));
+    return exceptionName === "odoo.addons.web_progress.models.web_progress.BackgroundProgress";
+}, {sequence: 1});
@@ -1 +1,2 @@
 from . import test_web_progress
+from . import test_web_progress_benchmark
@@ -1,10 +1,20 @@
 from odoo.tests import common, tagged
-from odoo import exceptions, api, registry
+from odoo import exceptions, api, registry, fields
 from odoo.tools import mute_logger
 from psycopg2 import ProgrammingError
 import uuid
+import json
 import logging
-from ..models.web_progress import last_report_time
+import os
+import tempfile
+import time
+from unittest.mock import patch, Mock
+from ..models.progress_state import progress_states, get_state, release_state, reap_states
+from ..controllers.main import StreamingXlsxWriter
+from ..models.cancel_listener import CancelListener
+from ..models.progress_writer import ProgressWriter
+from ..models.web_progress_cron_run import CronRunInfo
+from ..models.shared_registry import SharedProgressRegistry
 
 _logger = logging.getLogger(__name__)
 
@@ -16,7 +26,7 @@ class WebProgressTest(common.TransactionCase):
         """
         Check that all global progress data is empty after tests
         """
-        self.assertFalse(last_report_time, msg="Global variable last_report_time shall be empty by now")
+        self.assertFalse(progress_states, msg="Global variable progress_states shall be empty by now")
 
     def setUp(self):
         super(WebProgressTest, self).setUp()
@@ -108,6 +118,71 @@ class WebProgressTest(common.TransactionCase):
             self._check_web_progress_iter_recordset_many(0)
         self._check_web_progress_cancelled()
 
+    def test_web_progress_iter_push_cancel(self):
+        """
+        Check that a cancel notified by the cancel listener is respected by the next iteration
+        """
+        progress_code = str(uuid.uuid4())
+        self.partner_ids = self.partner_ids.with_context(progress_code=progress_code)
+        with patch.object(type(self.web_progress_obj), '_progress_push_cancel', True), \
+                patch.object(CancelListener, 'start_listener'), patch.object(CancelListener, 'notify') as notify:
+            with self.assertRaises(exceptions.UserError, msg="Exception UserError shall have been raised"):
+                for idx, partner_id in enumerate(self.partner_ids.with_progress(msg="Push cancel")):
+                    if idx == 0:
+                        self.assertTrue(get_state(progress_code).backend_pid, msg="Backend pid shall be known")
+                    if idx == 2:
+                        self.partner_ids.web_progress_cancel()
+                        notify.assert_called_once_with(self.env.cr.dbname, progress_code)
+                        CancelListener(False).cancel(None, self.env.cr.dbname, progress_code)
+                    self.assertLess(idx, 3, msg="Iteration shall be cancelled at once")
+        progress_code = str(uuid.uuid4())
+        self.partner_ids = self.partner_ids.with_context(progress_code=progress_code)
+        with patch.object(type(self.web_progress_obj), '_progress_push_cancel', True), \
+                patch.object(CancelListener, 'start_listener'):
+            for idx, partner_id in enumerate(self.partner_ids.with_progress(msg="Not cancellable",
+                                                                           cancellable=False)):
+                if idx == 2:
+                    CancelListener(True).cancel(None, self.env.cr.dbname, progress_code)
+                    self.assertFalse(get_state(progress_code).cancelled,
+                                     msg="Operation that is not cancellable shall not be cancelled")
+
+    def test_web_progress_iter_budget(self):
+        """
+        Check that an operation exceeding its time budget is cancelled
+        """
+        progress_code = str(uuid.uuid4())
+        self.partner_ids = self.partner_ids.with_context(progress_code=progress_code)
+        with patch.object(type(self.web_progress_obj), '_progress_period_secs', 0):
+            with self.assertRaises(exceptions.UserError, msg="Exception UserError shall have been raised"):
+                for idx, partner_id in enumerate(self.partner_ids.with_progress(msg="Budget", time_budget=0.01)):
+                    time.sleep(0.02)
+                    self.assertLess(idx, 2, msg="Iteration shall be cancelled when the budget is exceeded")
+            # the budget of a nested iteration applies to every run of the nested iteration only
+            for partner_id in self.partner_ids[:4].with_progress(msg="Outer"):
+                for _idx in self.partner_ids.web_progress_iter(range(2), msg="Inner", time_budget=0.5):
+                    time.sleep(0.1)
+
+    def test_web_progress_iter_instrumentation(self):
+        """
+        Check that instrumented iterations report SQL queries per element of every depth in the done record
+        """
+        progress_code = str(uuid.uuid4())
+        self.partner_ids = self.partner_ids.with_context(progress_code=progress_code, progress_instrument=True)
+        for partner_id in self.partner_ids.with_progress(msg="Instrumented"):
+            for _idx in self.partner_ids.web_progress_iter(range(2), msg="Sub-level"):
+                self.env.cr.execute("SELECT 1")
+        with registry(self.env.cr.dbname).cursor() as new_cr:
+            new_cr.execute("""
+            SELECT instrumentation FROM web_progress WHERE code = %s AND state = 'done' AND recur_depth = 0
+            """, (progress_code,))
+            instrumentation = json.loads(new_cr.fetchone()[0])
+        self.assertEqual(instrumentation['0']['elements'], 20)
+        self.assertEqual(instrumentation['1']['elements'], 40, msg="Sub-level iterations shall be accumulated")
+        self.assertGreaterEqual(instrumentation['1']['queries'], 1)
+        self.assertEqual(len(instrumentation['0']['slowest']), 5)
+        self.assertIn(instrumentation['0']['slowest'][0][0], self.partner_ids.ids,
+                      msg="Slowest elements shall be identified by record id")
+
     def test_web_progress_percent(self):
         """
         Check web_progress_percent
@@ -118,6 +193,312 @@ class WebProgressTest(common.TransactionCase):
         self.partner_ids.web_progress_percent(50, "Middle")
         self.partner_ids.web_progress_percent(100, "End")
 
+    def test_with_progress_batches(self):
+        """
+        Check that batch iteration yields all records in batches and supports adaptive batch size
+        """
+        progress_code = str(uuid.uuid4())
+        self.partner_ids = self.partner_ids.with_context(progress_code=progress_code)
+        batches = list(self.partner_ids.with_progress(msg="Batches", batch_size=6))
+        self.assertEqual([len(batch) for batch in batches], [6, 6, 6, 2])
+        self.assertEqual(sum(batches, self.partner_obj).ids, self.partner_ids.ids)
+        self.assertEqual(batches[0]._prefetch_ids, tuple(batches[0].ids), msg="Only the batch shall be prefetched")
+        count = 0
+        for batch in self.partner_ids.web_progress_batches(msg="Adaptive", batch_size=1, adaptive=True):
+            count += len(batch)
+        self.assertEqual(count, len(self.partner_ids), msg="Not all records are yielded in batches")
+        for batch in self.partner_ids.with_progress(msg="Interrupted", batch_size=6):
+            break
+        self.assertEqual(self.partner_obj._web_progress_batch_size(100, 10.0, 0), 50,
+                         msg="Batch size shall be reduced at most by half")
+
+    def test_with_progress_checkpoint(self):
+        """
+        Check that an unfinished iteration with a checkpoint is resumed after the processed elements
+        """
+        progress_code = str(uuid.uuid4())
+        self.partner_ids = self.partner_ids.with_context(progress_code=progress_code)
+        checkpoint_obj = self.env['web.progress.checkpoint'].sudo()
+        with patch.object(type(self.web_progress_obj), '_progress_period_secs', 0):
+            for partner_id in self.partner_ids.with_progress(msg="Interrupted", checkpoint_key='test_checkpoint'):
+                if partner_id == self.partner_ids[4]:
+                    break
+            checkpoint = checkpoint_obj.search([('key', '=', 'test_checkpoint')])
+            self.assertEqual(checkpoint.last_id, self.partner_ids[3].id)
+            resumed = self.partner_obj
+            for partner_id in self.partner_ids.with_progress(msg="Resumed", checkpoint_key='test_checkpoint'):
+                resumed |= partner_id
+            self.assertEqual(resumed, self.partner_ids[4:], msg="Processed records shall be skipped")
+            self.assertFalse(checkpoint.exists(), msg="Checkpoint shall be removed when the iteration is finished")
+            batches = self.partner_ids.with_progress(msg="Batches", batch_size=6, checkpoint_key='test_checkpoint')
+            next(batches)
+            # the first batch is processed once the second one is requested
+            next(batches)
+            batches.close()
+            batches = list(self.partner_ids.with_progress(msg="Batches", batch_size=6,
+                                                          checkpoint_key='test_checkpoint'))
+            self.assertEqual(sum(batches, self.partner_obj), self.partner_ids[6:])
+            self.assertEqual(list(self.web_progress_obj.web_progress_iter(range(10), checkpoint_key='test_range')),
+                             list(range(10)))
+
+    def test_import_batches(self):
+        """
+        Check that imported records are created by batches and an error in a batch fails the whole import
+        """
+        progress_code = str(uuid.uuid4())
+        partner_obj = self.partner_obj.with_context(progress_code=progress_code)
+        rows = [['Import{}'.format(idx), 'import{}@test.me'.format(idx)] for idx in range(5)]
+        with patch.object(type(self.web_progress_obj), '_progress_import_batch_size', 2):
+            res = partner_obj.load(['name', 'email'], rows)
+            self.assertFalse(res['messages'])
+            self.assertEqual(partner_obj.browse(res['ids']).mapped('name'), [row[0] for row in rows])
+            res = partner_obj.load(['name', 'email'], rows + [['', 'no.name@test.me']])
+            self.assertFalse(res['ids'], msg="No record shall be imported if any of them fails")
+            self.assertTrue(res['messages'], msg="The wrong record shall be reported")
+
+    def test_import_parse_cache(self):
+        """
+        Check that the import of a file reuses the data parsed by its test
+        """
+        progress_code = str(uuid.uuid4())
+        import_wizard = self.env['base_import.import'].with_context(progress_code=progress_code).create({
+            'res_model': 'res.partner',
+            'file': b'name,email\nImport1,import1@test.me\nImport2,import2@test.me\n',
+            'file_name': 'partners.csv',
+            'file_type': 'text/csv',
+        })
+        options = {'has_headers': True, 'separator': ',', 'quoting': '"', 'encoding': 'utf-8'}
+        with patch.object(type(self.web_progress_obj), '_progress_import_cache_size', 2):
+            res = import_wizard.execute_import(['name', 'email'], ['name', 'email'], options, dryrun=True)
+            self.assertFalse(res['messages'])
+            with patch.object(type(import_wizard), '_read_file', side_effect=AssertionError("File parsed again")):
+                res = import_wizard.execute_import(['name', 'email'], ['name', 'email'], options)
+            self.assertFalse(res['messages'])
+            self.assertEqual(self.partner_obj.browse(res['ids']).mapped('email'),
+                             ['import1@test.me', 'import2@test.me'])
+            # a skipped column
+            res = import_wizard.execute_import(['name', False], ['name', 'email'], options, dryrun=True)
+            self.assertFalse(res['messages'])
+            with patch.object(type(import_wizard), '_read_file', side_effect=AssertionError("File parsed again")):
+                res = import_wizard.execute_import(['name', False], ['name', 'email'], options)
+            self.assertFalse(res['messages'])
+            self.assertEqual(self.partner_obj.browse(res['ids']).mapped('email'), [False, False])
+
+    def test_export_data_batches(self):
+        """
+        Check that rows exported by batches are the same as rows exported at once
+        """
+        progress_code = str(uuid.uuid4())
+        self.partner_ids = self.partner_ids.with_context(progress_code=progress_code)
+        rows_batches = list(self.partner_ids._export_data_batches(['name', 'email']))
+        self.assertEqual(len(rows_batches), 1, msg="20 records shall be exported in one batch")
+        self.assertEqual(sum(rows_batches, []), self.partner_ids.export_data(['name', 'email'])['datas'])
+
+    def test_streaming_xlsx_writer(self):
+        """
+        Check that the streaming XLSX writer writes into the given file in constant memory mode
+        """
+        with patch('odoo.addons.web.controllers.export.request', Mock(env=self.env)), \
+                tempfile.TemporaryFile() as fileobj:
+            with StreamingXlsxWriter(['Name', 'Email'], 1, fileobj) as xlsx_writer:
+                xlsx_writer.write_cell(1, 0, 'Test')
+                self.assertTrue(xlsx_writer.workbook.constant_memory)
+                self.assertIn(xlsx_writer.header_style, xlsx_writer.workbook.formats,
+                              msg="Formats shall belong to the streaming workbook")
+            fileobj.seek(0)
+            self.assertEqual(fileobj.read(2), b'PK', msg="XLSX file shall be written into the given file")
+
+    def test_web_progress_map(self):
+        """
+        Check that web_progress_map processes all chunks in workers and respects cancel
+        """
+        progress_code = str(uuid.uuid4())
+        country_ids = self.env['res.country'].search([], limit=50)
+        country_obj = self.env['res.country'].with_context(progress_code=progress_code)
+        res = country_obj.web_progress_map(lambda chunk: chunk.mapped('code'), country_ids, workers=3,
+                                           chunk_size=7, msg="Map", commit=False)
+        self.assertEqual(len(res), (len(country_ids) + 6) // 7, msg="Every chunk shall have a result")
+        self.assertEqual(sum(res, []), country_ids.mapped('code'), msg="Results shall be in the order of chunks")
+        country_obj.web_progress_cancel()
+        with self.assertRaises(exceptions.UserError, msg="Exception UserError shall have been raised"):
+            country_obj.web_progress_map(lambda chunk: chunk.ids, country_ids, workers=3, chunk_size=7,
+                                         msg="Map", commit=False)
+
+    def test_get_progress_memory(self):
+        """
+        Check that progress of an operation running in the current process is available from memory
+        """
+        progress_code = str(uuid.uuid4())
+        self.partner_ids = self.partner_ids.with_context(progress_code=progress_code)
+        for partner_id in self.partner_ids.with_progress(msg="Level 0"):
+            for sub_partner_id in self.partner_ids.with_progress(msg="Level 1"):
+                res = self.web_progress_obj._get_progress_memory([progress_code, str(uuid.uuid4())])
+                self.assertEqual(list(res), [progress_code], msg="Only the running operation shall be found")
+                self.assertEqual([p['msg'] for p in res[progress_code]], ["Level 0", "Level 1"])
+                self.assertEqual(res[progress_code][0]['uid'], self.env.uid)
+                break
+            break
+        self.assertFalse(self.web_progress_obj._get_progress_memory([progress_code]),
+                         msg="Finished operation shall not be in memory")
+
+    def test_progress_writer(self):
+        """
+        Check that the background writer buffers only the newest report of an operation
+        and stores all buffered reports on flush
+        """
+        progress_codes = [str(uuid.uuid4()) for idx in range(3)]
+        writer = ProgressWriter(self.env.cr.dbname, 1.0, 2)
+        self.addCleanup(writer.close)
+        for progress in (10, 20):
+            vals = dict(code=progress_codes[0], recur_depth=0, progress=progress, state='ongoing')
+            self.assertTrue(writer.put(self.env.uid, [vals]), msg="Report shall be buffered")
+        vals = dict(code=progress_codes[1], recur_depth=0, progress=30, state='ongoing')
+        self.assertTrue(writer.put(self.env.uid, [vals]), msg="Report shall be buffered")
+        vals = dict(code=progress_codes[2], recur_depth=0, progress=40, state='ongoing')
+        self.assertFalse(writer.put(self.env.uid, [vals]), msg="Report shall be refused by a full buffer")
+        self.assertEqual(list(writer.pending), progress_codes[:2], msg="Only the newest report shall be buffered")
+        writer.flush()
+        self.assertFalse(writer.pending, msg="Buffer shall be empty after flush")
+        with registry(self.env.cr.dbname).cursor() as new_cr:
+            progress_obj = self.web_progress_obj.with_env(api.Environment(new_cr, self.env.uid, {}))
+            self.assertEqual([p['progress'] for p in progress_obj.get_progress(progress_codes[0])], [20])
+            self.assertEqual([p['progress'] for p in progress_obj.get_progress(progress_codes[1])], [30])
+
+    def test_get_progress_multi(self):
+        """
+        Check that progress of many operations is returned with all recursion depths
+        """
+        progress_codes = [str(uuid.uuid4()) for idx in range(2)]
+        self.web_progress_obj.create([dict(code=progress_codes[0], recur_depth=0, msg="Level 0", state='ongoing'),
+                                      dict(code=progress_codes[0], recur_depth=1, msg="Level 1", state='ongoing'),
+                                      dict(code=progress_codes[1], recur_depth=0, msg="Other", state='ongoing')])
+        res = self.web_progress_obj.get_progress_multi(progress_codes)
+        self.assertEqual([p['msg'] for p in res[progress_codes[0]]], ["Level 0", "Level 1"])
+        self.assertEqual([p['msg'] for p in res[progress_codes[1]]], ["Other"])
+        self.assertEqual(res[progress_codes[1]][0]['user'], self.env.user.name)
+        res = self.web_progress_obj.get_progress(progress_codes[0], recur_depth=1)
+        self.assertEqual([p['msg'] for p in res], ["Level 1"])
+        res = self.web_progress_obj.get_progress(str(uuid.uuid4()))
+        self.assertEqual(len(res), 1, msg="Progress of an unknown operation shall be empty")
+        self.assertFalse(res[0]['state'], msg="Progress of an unknown operation shall be empty")
+
+    def test_shared_registry(self):
+        """
+        Check that the shared progress registry keeps the latest progress of every operation
+        """
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        shared = SharedProgressRegistry(path, 4, 512, ttl=3600, final_ttl=3600)
+        progress_codes = [str(uuid.uuid4()) for idx in range(5)]
+        for progress in (10, 20):
+            self.assertTrue(shared.write(progress_codes[0], [dict(code=progress_codes[0], progress=progress)]))
+        self.assertEqual(shared.read(progress_codes[0]), [dict(code=progress_codes[0], progress=20)])
+        self.assertIsNone(shared.read(progress_codes[1]), msg="Unknown operation shall not be found")
+        for code in progress_codes[1:4]:
+            self.assertTrue(shared.write(code, [dict(code=code)], final=True))
+        self.assertFalse(shared.write(progress_codes[4], [dict(code=progress_codes[4])]),
+                         msg="Operation shall not be written into a full registry")
+        self.assertFalse(shared.write(progress_codes[0], [dict(msg='x' * 512)]),
+                         msg="Progress too big for a slot shall not be written")
+        self.assertIsNone(shared.read(progress_codes[0]), msg="Outdated progress shall not be read")
+        # another process maps the same file
+        self.assertEqual(SharedProgressRegistry(path, 4, 512, ttl=3600, final_ttl=3600).read(progress_codes[3]),
+                         [dict(code=progress_codes[3])])
+
+    def test_background_job(self):
+        """
+        Check that a job repeats the call of an operation moved to background and keeps its result
+        """
+        job = self.env['web.progress.job'].sudo().create({
+            'name': 'res.partner.search_count',
+            'code': str(uuid.uuid4()),
+            'params': json.dumps({'model': 'res.partner', 'method': 'search_count',
+                                  'args': [[('id', 'in', self.partner_ids.ids)]], 'kwargs': {}}),
+        })
+        with patch.object(type(self.env.cr), 'commit'):
+            self.env['web.progress.job']._cron_run_jobs()
+        self.assertEqual(job.state, 'waiting', msg="Job shall wait until the original operation is cancelled")
+        job.state = 'pending'
+        with patch.object(type(self.env.cr), 'commit'):
+            self.env['web.progress.job']._cron_run_jobs()
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(json.loads(job.result), len(self.partner_ids))
+        with self.assertRaises(exceptions.UserError, msg="Operation not in progress shall not be moved"):
+            self.web_progress_obj.move_to_background(str(uuid.uuid4()), 'call_kw', {})
+        origin_code = str(uuid.uuid4())
+        for partner_id in self.partner_ids.with_context(progress_code=origin_code).with_progress(msg="Finished"):
+            pass
+        job = job.copy({'code': str(uuid.uuid4()), 'origin_code': origin_code, 'state': 'pending',
+                        'activation_date': fields.Datetime.add(fields.Datetime.now(), seconds=1), 'result': False})
+        with patch.object(type(self.env.cr), 'commit'):
+            self.env['web.progress.job']._cron_run_jobs()
+        self.assertEqual(job.state, 'failed', msg="Job of a finished operation shall not be run")
+        user = self.env['res.users'].create({'name': "Progress User", 'login': 'web_progress_user',
+                                             'groups_id': [(6, 0, [self.env.ref('base.group_user').id])]})
+        with self.assertRaises(exceptions.UserError, msg="Operation of another user shall not be moved"):
+            self.web_progress_obj.with_user(user).move_to_background(origin_code, 'call_kw', {})
+        params = self.web_progress_obj._parse_report_download({
+            'data': json.dumps(['/report/pdf/base.report_irmodulereference/1,2', 'qweb-pdf']),
+            'context': json.dumps({'lang': 'en_US'}),
+        })
+        self.assertEqual(params, dict(report_name='base.report_irmodulereference', docids=[1, 2], data=None,
+                                      context={'lang': 'en_US'}))
+
+    def test_progress_states_reaper(self):
+        """
+        Check that progress never reported as finished is listed and then reaped
+        """
+        progress_code = str(uuid.uuid4())
+        self.partner_ids.with_context(progress_code=progress_code).web_progress_percent(50, "Never finished")
+        info = self.web_progress_obj.get_progress_states()
+        states = [state for state in info['states'] if state['code'] == progress_code]
+        self.assertEqual(len(states), 1)
+        self.assertGreater(states[0]['size'], 0)
+        self.assertTrue(states[0]['thread_alive'])
+        get_state(progress_code).last_access -= 10
+        self.assertGreaterEqual(reap_states(5), 1)
+        self.assertIsNone(get_state(progress_code), msg="Expired state shall be reaped")
+
+    def test_get_progress_compact(self):
+        """
+        Check that compact progress carries numbers and messages only when they change
+        """
+        progress_code = str(uuid.uuid4())
+        state = get_state(progress_code, uid=self.env.uid, create=True)
+        self.addCleanup(release_state, state)
+        vals_list = [dict(code=progress_code, recur_depth=0, msg="Level 0", progress=50, done=1, total=2,
+                          progress_total=75.0, time_left='0:01:05', time_total='1:00:00', time_secs=[65, 3600, None],
+                          state='ongoing'),
+                     dict(code=progress_code, recur_depth=1, msg="Level 1", progress=50, done=2, total=4,
+                          progress_total=75.0, state='ongoing')]
+        res = self.web_progress_obj._get_progress_compact(vals_list, state, self.env.user)
+        self.assertEqual(res['levels'], [[50, 1, 2], [50, 2, 4]])
+        self.assertEqual(res['time'], [65, 3600, None])
+        self.assertEqual(res['msgs'], ["Level 0", "Level 1"])
+        res = self.web_progress_obj._get_progress_compact(vals_list, state, self.env.user)
+        self.assertNotIn('msgs', res, msg="Unchanged messages shall not be sent again")
+        vals_list[1]['msg'] = "Level 1 again"
+        res = self.web_progress_obj._get_progress_compact(vals_list, state, self.env.user)
+        self.assertEqual(res['msgs'], ["Level 0", "Level 1 again"])
+
+    def test_upsert_progress(self):
+        """
+        Check that upsert mode keeps one record per code and recursion depth and never overwrites cancel state
+        """
+        progress_code = str(uuid.uuid4())
+        self.web_progress_obj._init_progress_index(upsert=True)
+        self.web_progress_obj._upsert_progress([dict(code=progress_code, recur_depth=0, progress=10, state='ongoing'),
+                                                dict(code=progress_code, recur_depth=1, progress=20, state='ongoing')])
+        self.web_progress_obj._upsert_progress([dict(code=progress_code, recur_depth=0, progress=30, state='ongoing')])
+        progress_ids = self.web_progress_obj.search([('code', '=', progress_code)], order='recur_depth')
+        self.assertEqual(progress_ids.mapped('progress'), [30, 20], msg="Records shall be updated in place")
+        self.web_progress_obj._upsert_progress([dict(code=progress_code, state='cancel')])
+        self.web_progress_obj._upsert_progress([dict(code=progress_code, recur_depth=0, progress=40, state='ongoing')])
+        progress_ids = self.web_progress_obj.search([('code', '=', progress_code)], order='recur_depth')
+        self.assertEqual(progress_ids.mapped('progress'), [40, 20], msg="Records shall be updated in place")
+        self.assertEqual(progress_ids[0].state, 'cancel', msg="Cancel state shall not be overwritten")
+
 
 class WebProgressTestAllProgress(common.TransactionCase):
     at_install = True
@@ -145,3 +526,52 @@ class WebProgressTestAllProgress(common.TransactionCase):
                                               "SELECT code, array_agg(state) FROM web_progress "
                                               "WHERE create_date > timezone('utc', now()) - INTERVAL '10")
             new_cr.rollback()
+
+    def test_cron_run_vals(self):
+        """
+        Check statistics of a cron run computed from its progress
+        """
+        progress_code = str(uuid.uuid4())
+        run_info = CronRunInfo(progress_code)
+        for partner_id in self.env['res.partner'].search([], limit=20).with_context(
+                progress_code=progress_code, web_progress_cron_run=run_info).with_progress(msg="Cron"):
+            pass
+        self.assertGreater(run_info.peak_rate, 0.0, msg="Peak rate shall be sampled from progress reports")
+        cron = self.env.ref('web_progress.ir_cron_web_progress_job')
+        with registry(self.env.cr.dbname).cursor() as new_cr:
+            run_obj = self.env['web.progress.cron.run'].with_env(api.Environment(new_cr, self.env.uid, {}))
+            vals = run_obj._get_run_vals(cron.id, progress_code, 2.0)
+        self.assertEqual(vals['state'], 'done')
+        self.assertEqual(vals['items'], 20)
+        self.assertEqual(vals['items_per_sec'], 10.0)
+        self.assertFalse(vals['slow'], msg="A run cannot be slow without previous runs")
+
+    def test_websocket_admin_channel(self):
+        """
+        Check that only progress admins are subscribed to progress of all users
+        """
+        user = self.env['res.users'].create({'name': "Progress User", 'login': 'web_progress_user',
+                                             'groups_id': [(6, 0, [self.env.ref('base.group_user').id])]})
+        channels = self.env['ir.websocket'].with_user(user)._build_bus_channel_list(['web_progress_admin'])
+        self.assertNotIn('web_progress_admin', channels, msg="Admin channel shall be removed")
+        channels = self.env['ir.websocket']._build_bus_channel_list([])
+        self.assertIn('web_progress_admin', channels, msg="Admin shall be subscribed to the admin channel")
+
+    def test_get_all_progress_active(self):
+        """
+        Check that only ongoing operations are listed by get_all_progress
+        """
+        progress_codes = [str(uuid.uuid4()) for idx in range(3)]
+        for code in progress_codes:
+            self.env['res.partner'].with_context(progress_code=code).web_progress_percent(0, "Start")
+        self.env['res.partner'].with_context(progress_code=progress_codes[1]).web_progress_percent(100, "End")
+        self.env['web.progress'].cancel_progress(progress_codes[2])
+        with registry(self.env.cr.dbname).cursor() as new_cr:
+            progress_obj = self.env['web.progress'].with_env(api.Environment(new_cr, self.env.uid, {}))
+            res = [p['code'] for p in progress_obj.get_all_progress() if p['code'] in progress_codes]
+            self.assertEqual(res, progress_codes[:1], msg="Done and cancelled operations shall not be listed")
+            new_cr.execute("SELECT code FROM web_progress_active WHERE code IN %s", (tuple(progress_codes),))
+            self.assertEqual(sorted(r[0] for r in new_cr.fetchall()), sorted(progress_codes[::2]),
+                             msg="Done operations shall be removed from active operations")
+        for code in progress_codes[::2]:
+            self.env['res.partner'].with_context(progress_code=code).web_progress_percent(100, "End")
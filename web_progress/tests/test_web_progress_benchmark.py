@@ -0,0 +1,184 @@
+from odoo.tests import common, tagged
+from odoo import api, registry
+from odoo.modules.module import get_manifest
+from odoo.sql_db import Cursor
+from threading import Lock, Thread
+from unittest.mock import patch
+import json
+import logging
+import os
+import time
+import uuid
+from ..models.progress_writer import ProgressWriter
+
+_logger = logging.getLogger(__name__)
+
+# comma-separated collection sizes, number of concurrent threads and path of the JSON results file
+BENCHMARK_SIZES = [int(size) for size in
+                   os.environ.get('WEB_PROGRESS_BENCHMARK_SIZES', '1000,10000,100000,1000000').split(',')]
+BENCHMARK_THREADS = int(os.environ.get('WEB_PROGRESS_BENCHMARK_THREADS', 4))
+BENCHMARK_OUTPUT = os.environ.get('WEB_PROGRESS_BENCHMARK_OUTPUT')
+
+
+@tagged('web_progress_benchmark', '-standard', '-at_install', 'post_install')
+class WebProgressBenchmark(common.TransactionCase):
+    """
+    Overhead of progress reporting, excluded from standard test runs. Run with:
+    odoo-bin -d <db> -u web_progress --test-tags web_progress_benchmark --stop-after-init
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(WebProgressBenchmark, cls).setUpClass()
+        cls.results = []
+        cls.commits = 0
+        cls.commits_lock = Lock()
+
+    @classmethod
+    def tearDownClass(cls):
+        web_progress_obj = cls.env['web.progress']
+        output = dict(version=get_manifest('web_progress').get('version'),
+                      options={'async': web_progress_obj._progress_async,
+                               'upsert': web_progress_obj._progress_upsert,
+                               'shm': web_progress_obj._progress_shm},
+                      results=cls.results)
+        if BENCHMARK_OUTPUT:
+            with open(BENCHMARK_OUTPUT, 'w') as f:
+                json.dump(output, f, indent=1)
+        _logger.info("web_progress benchmark results: {}".format(json.dumps(output)))
+        super(WebProgressBenchmark, cls).tearDownClass()
+
+    def _count_commit(self, cr):
+        with self.commits_lock:
+            type(self).commits += 1
+        return self.original_commit(cr)
+
+    def setUp(self):
+        super(WebProgressBenchmark, self).setUp()
+        self.original_commit = Cursor.commit
+        patcher = patch.object(Cursor, 'commit', autospec=True, side_effect=self._count_commit)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _count_rows(self, codes):
+        """
+        Count progress records stored (and committed) for given operations and remove them
+        :param codes: list of progress codes
+        :return: number of records
+        """
+        writer = ProgressWriter.get_running(self.env.cr.dbname)
+        if writer:
+            writer.flush()
+        with registry(self.env.cr.dbname).cursor() as new_cr:
+            new_cr.execute("SELECT count(*) FROM web_progress WHERE code IN %s", (tuple(codes),))
+            rows = new_cr.fetchone()[0]
+            new_cr.execute("DELETE FROM web_progress WHERE code IN %s", (tuple(codes),))
+        return rows
+
+    def _measure(self, name, size, run, depth=1, threads=1):
+        """
+        Measure one benchmark and record its result
+        :param name: name of the benchmark
+        :param size: number of iterated elements (of all levels)
+        :param run: function(progress_code) iterating the elements, with progress if progress_code is given
+        :param depth: recursion depth of iterations
+        :param threads: number of concurrent threads
+        """
+        def run_threads(codes):
+            if threads == 1:
+                run(codes[0])
+                return
+            workers = [Thread(target=run, args=(code,)) for code in codes]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        commits = self.commits
+        start = time.perf_counter()
+        run_threads([None] * threads)
+        baseline_secs = time.perf_counter() - start
+        # commits of the benchmark itself (e.g. of cursors of threads) are not counted
+        baseline_commits, commits = self.commits - commits, self.commits
+        codes = [str(uuid.uuid4()) for idx in range(threads)]
+        start = time.perf_counter()
+        run_threads(codes)
+        secs = time.perf_counter() - start
+        commits = self.commits - commits - baseline_commits
+        rows = self._count_rows(codes)
+        result = dict(name=name, size=size, depth=depth, threads=threads,
+                      secs=secs, baseline_secs=baseline_secs,
+                      overhead_ns=(secs - baseline_secs) * 1e9 / (size * threads),
+                      rows=rows / threads, commits=commits / threads)
+        _logger.info("web_progress benchmark {}: {}".format(name, result))
+        self.results.append(result)
+
+    def _iterate_nested(self, model, sizes):
+        """
+        Iterate nested ranges, each level wrapped with progress reporting
+        :param model: model with or without progress_code in context
+        :param sizes: list of range sizes, one per level
+        :return: number of iterated elements of all levels
+        """
+        count = 0
+        for idx in model.web_progress_iter((idx for idx in range(sizes[0])), msg="Benchmark", total=sizes[0]):
+            count += 1
+            if len(sizes) > 1:
+                count += self._iterate_nested(model, sizes[1:])
+        return count
+
+    def _run_in_thread(self, progress_code, function):
+        """
+        Run a function with a model of a fresh cursor, the way concurrent requests do
+        """
+        with registry(self.env.cr.dbname).cursor() as new_cr:
+            env = api.Environment(new_cr, self.env.uid, progress_code and {'progress_code': progress_code} or {})
+            function(env['res.partner'])
+
+    def test_with_progress(self):
+        """
+        Overhead of iterating a recordset wrapped by with_progress
+        """
+        for size in BENCHMARK_SIZES:
+            records = self.env['res.partner'].browse(range(1, size + 1))
+
+            def run(progress_code):
+                for record in records.with_context(progress_code=progress_code).with_progress(msg="Benchmark"):
+                    pass
+            self._measure('with_progress', size, run)
+
+    def test_web_progress_iter(self):
+        """
+        Overhead of iterating a generator wrapped by web_progress_iter, in one and in many threads
+        """
+        for size in BENCHMARK_SIZES:
+            for threads in (1, BENCHMARK_THREADS):
+                self._measure('web_progress_iter', size,
+                              lambda code: self._run_in_thread(code, lambda model: self._iterate_nested(model, [size])),
+                              threads=threads)
+
+    def test_web_progress_percent(self):
+        """
+        Overhead of reporting progress by web_progress_percent
+        """
+        for size in BENCHMARK_SIZES:
+
+            def run(progress_code):
+                model = self.env['res.partner'].with_context(progress_code=progress_code)
+                for idx in range(size):
+                    model.web_progress_percent(idx * 100 // size, "Benchmark")
+                model.web_progress_percent(100, "Benchmark")
+            self._measure('web_progress_percent', size, run)
+
+    def test_web_progress_iter_nested(self):
+        """
+        Overhead of nested iterations of recursion depths 1 to 5, with about the same number of elements in total
+        """
+        for size in BENCHMARK_SIZES:
+            for depth in range(1, 6):
+                sizes = [max(round(size ** (1.0 / depth)), 1)] * depth
+                total = sum(sizes[0] ** level for level in range(1, depth + 1))
+                self._measure('web_progress_iter_nested', total,
+                              lambda code: self._iterate_nested(self.env['res.partner'].
+                                                                with_context(progress_code=code), sizes),
+                              depth=depth)